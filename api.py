@@ -3,9 +3,22 @@ import pandas as pd
 from simple_salesforce import Salesforce, SalesforceLogin, SFType
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk import Bulk2Api
+from composite import CollectionsApi
+from limits import limits
+from sessions import sessions
 
 preference_fname = 'settings/preferences.json'
 
+# keeps every chunked query URL well below Salesforce's 16k URI limit
+max_in_clause_length = 4000
+
+# writes up to this many rows go through sObject Collections, larger ones
+# through a Bulk job
+collections_threshold = 2000
+
 
 def read_preferences():
     preferences = {}
@@ -21,20 +34,65 @@ def save_preferences(preferences):
 
 class SFApi:
 
-    def __init__(self):
+    def __init__(self, collections_threshold=collections_threshold):
         self.sf = None
+        self.collections_threshold = collections_threshold
 
     @staticmethod
-    def _normalize_records(df):
-        if not isinstance(df, pd.Series):
-            df = pd.DataFrame(df)
+    def _flatten_record(record, idx, prefix, columns, n_records):
+        for key, value in record.items():
+            if key == 'attributes':
+                continue
+            name = prefix + key
+            if isinstance(value, dict) and 'attributes' in value:
+                SFApi._flatten_record(
+                    value, idx, name + '.', columns, n_records)
+            elif isinstance(value, dict) and 'records' in value:
+                # child subquery, flattened as its first child record
+                if len(value['records']) > 0:
+                    SFApi._flatten_record(
+                        value['records'][0], idx, name + '.', columns, n_records)
+            elif value is None and key[-3:] == '__r':
+                continue
+            else:
+                col = columns.get(name)
+                if col is None:
+                    col = columns[name] = [None] * n_records
+                col[idx] = value
 
-        df = df.apply(pd.Series)
-        if len(df) > 0:
-            df.drop(labels=['attributes'], axis=1, inplace=True)
-        else:
-            df = None
-        return df
+    @staticmethod
+    def _explode_children(records):
+        # one row per combination of child records, like a SQL join; a
+        # parent without children of a relationship keeps a single row
+        rows = []
+        for record in records:
+            variants = [{}]
+            for key, value in record.items():
+                if isinstance(value, dict) and 'records' in value:
+                    if len(value['records']) > 0:
+                        variants = [dict(variant, **{key: child})
+                                    for variant in variants for child in value['records']]
+                else:
+                    for variant in variants:
+                        variant[key] = value
+            rows.extend(variants)
+        return rows
+
+    @staticmethod
+    def _normalize_records(records, children='first'):
+        if len(records) == 0:
+            return None
+        if children == 'rows':
+            records = SFApi._explode_children(records)
+
+        columns = {}
+        for idx, record in enumerate(records):
+            SFApi._flatten_record(record, idx, '', columns, len(records))
+
+        # relationship columns go after their parent level, as the old
+        # column-by-column expansion used to order them
+        names = sorted(columns, key=lambda name: name.count('.'))
+        return pd.DataFrame({name: columns[name] for name in names}, columns=names)
 
     @staticmethod
     def _get_domain(org):
@@ -43,15 +101,20 @@ class SFApi:
         else:
             return 'test'
 
-    def connect(self):
+    def connect(self, fresh=False):
         self.sf = None
         preferences = read_preferences()
         message = []
         try:
-            self.sf = Salesforce(username=preferences['entry_username'],
-                                 password=preferences['entry_password'],
-                                 security_token=preferences['entry_token_security'],
-                                 domain=self._get_domain(preferences['variable_radio']))
+            # logged in clients and their keep-alive connections are shared
+            # by every SFApi in the process; a fresh connect drops them, so
+            # the credentials really are checked against Salesforce again
+            if fresh:
+                sessions.forget()
+            self.sf = sessions.get(preferences['entry_username'],
+                                   preferences['entry_password'],
+                                   preferences['entry_token_security'],
+                                   self._get_domain(preferences['variable_radio']))
             message.append("LOGIN:SUCCESS")
         except Exception as e:
             message.append('LOGIN:FAILED')
@@ -59,38 +122,100 @@ class SFApi:
 
         return message
 
-    def query(self, soql, iteractive=False):
-        response = self.sf.query(soql)
-        lst_records = response.get('records')
-        if not iteractive:
-            nextRecordsUrl = response.get('nextRecordsUrl')
-
-            while not response.get('done'):
-                response = sf.query_more(
-                    nextRecordsUrl, identifier_is_url=True)
-                lst_records.extend(response.get('records'))
-                nextRecordsUrl = response.get('nextRecordsUrl')
-
-        df_records = self._normalize_records(lst_records)
-        restart = True
-        while restart:
-            restart = False
-            for col in df_records.columns:
-                if col[-3:] == '__r':
-                    restart = True
-                    s = self._normalize_records(
-                        df_records[col]).add_prefix(col+'.')
-                    df_records.drop(columns=[col], inplace=True)
-                    df_records = pd.concat([df_records, s], axis=1, sort=False)
-
-        return df_records
-
-    def upsert(self, obj_api, data_dict, what='Id'):
-        return getattr(self.sf.bulk, obj_api).upsert(data_dict, what)
-
-    def update(self, obj_api, data_dict):
-        return getattr(self.sf.bulk, obj_api).update(data_dict)
-
-    def insert(self, obj_api, data_dict):
-        # sobject = SFType(obj_api, self.sf.session_id, self.sf.sf_instance)
-        return getattr(self.sf.bulk, obj_api).insert(data_dict)
+    def _fetch_children(self, records):
+        # subqueries return at most a couple thousand children per parent,
+        # the rest has to be paged in like any other query
+        for record in records:
+            for value in record.values():
+                if isinstance(value, dict) and 'records' in value:
+                    while not value.get('done', True):
+                        more = self.sf.query_more(value['nextRecordsUrl'], identifier_is_url=True)
+                        value['records'].extend(more['records'])
+                        value['done'] = more['done']
+                        value['nextRecordsUrl'] = more.get('nextRecordsUrl')
+
+    def iter_query(self, soql, iteractive=False, include_deleted=False, children='first'):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            limits.check()
+            response = self.sf.query(soql, include_deleted=include_deleted)
+            while True:
+                future = None
+                if not iteractive and not response.get('done'):
+                    limits.check()
+                    future = executor.submit(
+                        self.sf.query_more, response.get('nextRecordsUrl'), identifier_is_url=True)
+
+                if children == 'rows':
+                    self._fetch_children(response.get('records'))
+                df_records = self._normalize_records(response.get('records'), children)
+                response = None
+                if df_records is not None:
+                    yield df_records
+
+                if future is None:
+                    break
+                response = future.result()
+
+    def query(self, soql, iteractive=False, include_deleted=False, children='first'):
+        chunks = list(self.iter_query(soql, iteractive, include_deleted, children))
+        if len(chunks) == 0:
+            return None
+        return pd.concat(chunks, ignore_index=True, sort=False)
+
+    @staticmethod
+    def _soql_quote(value):
+        return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+    @staticmethod
+    def _chunk_in_clauses(field, values, chunk_size):
+        chunk = []
+        length = 0
+        for value in values:
+            quoted = SFApi._soql_quote(value)
+            if len(chunk) > 0 and (len(chunk) >= chunk_size or length + len(quoted) + 2 > max_in_clause_length):
+                yield '{} IN ({})'.format(field, ', '.join(chunk))
+                chunk = []
+                length = 0
+            chunk.append(quoted)
+            length += len(quoted) + 2
+        if len(chunk) > 0:
+            yield '{} IN ({})'.format(field, ', '.join(chunk))
+
+    def query_in(self, soql_template, field, values, chunk_size=200, max_workers=4):
+        values = list(dict.fromkeys(v for v in values if not pd.isnull(v)))
+        soqls = [soql_template.format(clause)
+                 for clause in self._chunk_in_clauses(field, values, chunk_size)]
+
+        with ThreadPoolExecutor(max_workers=limits.workers(max_workers)) as executor:
+            chunks = [df for df in executor.map(self.query, soqls)
+                      if df is not None]
+
+        if len(chunks) == 0:
+            return None
+        return pd.concat(chunks, ignore_index=True, sort=False)
+
+    def _bulk(self, obj_api, operation, data, external_id=None):
+        # small writes skip the Bulk job lifecycle, whose polling alone
+        # takes longer than a few collection calls
+        # the header only tracks API requests, Bulk batches need /limits
+        limits.refresh_if_stale(self.sf)
+        if not limits.prefer_bulk(len(data), self.collections_threshold):
+            return CollectionsApi(self.sf).run(obj_api, operation, data, external_id)
+
+        return Bulk2Api(self.sf).run(obj_api, operation, data, external_id)
+
+    def field_types(self, obj_api):
+        return {field['name']: field['type'] for field in getattr(self.sf, obj_api).describe()['fields']}
+
+    @staticmethod
+    def limit_metrics():
+        return limits.metrics()
+
+    def upsert(self, obj_api, data, what='Id'):
+        return self._bulk(obj_api, 'upsert', data, what)
+
+    def update(self, obj_api, data):
+        return self._bulk(obj_api, 'update', data)
+
+    def insert(self, obj_api, data):
+        return self._bulk(obj_api, 'insert', data)
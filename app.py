@@ -206,7 +206,7 @@ class Application:
 
         self.button_check_login = Button(
             frame_st, text="Check Login", fg='#e8e8e8', background='#00334e', relief=FLAT,
-            command=lambda: self.message(frame_st, SFApi().connect()))
+            command=lambda: self.message(frame_st, SFApi().connect(fresh=True)))
 
         self._define_defaults()
 
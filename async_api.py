@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import aiohttp
+import pandas as pd
+from simple_salesforce.util import exception_handler
+
+from api import SFApi
+from limits import limits
+
+# sub requests the composite resource accepts per call
+composite_size = 25
+
+
+class RateLimiter:
+
+    def __init__(self, rate, per=1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+
+class AsyncSFApi:
+
+    def __init__(self, sf_api, max_concurrency=10, rate=25):
+        # borrows the login of a connected SFApi, so both share a session
+        self.sf = sf_api.sf
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.session = None
+
+    async def __aenter__(self):
+        # asyncio primitives are made here, inside the loop that uses them
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.limiter = RateLimiter(self.rate)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def _request(self, method, url, name='', retry_login=True, **kwargs):
+        session_id = self.sf.session_id
+        headers = {'Authorization': 'Bearer ' + session_id,
+                   'Content-Type': 'application/json',
+                   'Accept': 'application/json'}
+        await self.limiter.acquire()
+        async with self.semaphore:
+            async with self.session.request(method, url, headers=headers, **kwargs) as response:
+                content = await response.read()
+                status = response.status
+                limits.observe(response)
+
+        if status == 401 and retry_login and hasattr(self.sf, 'relogin'):
+            await asyncio.get_running_loop().run_in_executor(None, self.sf.relogin, session_id)
+            return await self._request(method, url, name, False, **kwargs)
+        if status >= 300:
+            # reuses simple_salesforce's mapping of status codes to errors,
+            # which reads the body the way a requests response offers it
+            exception_handler(SimpleNamespace(
+                status_code=status, url=str(url), text=content.decode('utf-8', errors='replace'),
+                json=lambda: json.loads(content)), name)
+        return json.loads(content) if content else None
+
+    def _url(self, path):
+        if path.startswith('/services/'):
+            return self.sf.base_url[:self.sf.base_url.index('/services/')] + path
+        return self.sf.base_url + path
+
+    async def _fetch_children(self, records):
+        # truncated subqueries are paged in like in SFApi._fetch_children,
+        # all of a page's relationships concurrently
+        async def page_in(value):
+            while not value.get('done', True):
+                more = await self._request('GET', self._url(value['nextRecordsUrl']), 'query_more')
+                value['records'].extend(more['records'])
+                value['done'] = more['done']
+                value['nextRecordsUrl'] = more.get('nextRecordsUrl')
+
+        await asyncio.gather(*[page_in(value) for record in records or () for value in record.values()
+                               if isinstance(value, dict) and 'records' in value])
+
+    async def iter_query(self, soql, include_deleted=False, children='first'):
+        response = await self._request(
+            'GET', self._url('queryAll/' if include_deleted else 'query/'), 'query', params={'q': soql})
+        next_page = None
+        try:
+            while True:
+                next_url = None if response.get('done') else response.get('nextRecordsUrl')
+                # the next page is fetched while this one is normalized
+                next_page = None
+                if next_url is not None:
+                    next_page = asyncio.ensure_future(self._request('GET', self._url(next_url), 'query_more'))
+
+                if children == 'rows':
+                    await self._fetch_children(response.get('records'))
+                df_records = SFApi._normalize_records(response.get('records'), children)
+                if df_records is not None:
+                    yield df_records
+
+                if next_page is None:
+                    break
+                response = await next_page
+        finally:
+            # a consumer stopping early leaves no request running behind it
+            if next_page is not None:
+                next_page.cancel()
+
+    async def query(self, soql, include_deleted=False, children='first'):
+        chunks = [df async for df in self.iter_query(soql, include_deleted, children)]
+        if len(chunks) == 0:
+            return None
+        return pd.concat(chunks, ignore_index=True, sort=False)
+
+    async def query_many(self, soqls, include_deleted=False):
+        return await asyncio.gather(*[self.query(soql, include_deleted) for soql in soqls])
+
+    async def query_in(self, soql_template, field, values, chunk_size=200):
+        values = list(dict.fromkeys(v for v in values if not pd.isnull(v)))
+        soqls = [soql_template.format(clause)
+                 for clause in SFApi._chunk_in_clauses(field, values, chunk_size)]
+        chunks = [df for df in await self.query_many(soqls) if df is not None]
+        if len(chunks) == 0:
+            return None
+        return pd.concat(chunks, ignore_index=True, sort=False)
+
+    async def composite(self, requests, all_or_none=False):
+        # requests are dicts with method, url and optionally body and
+        # referenceId; they go out 25 at a time, all chunks concurrently
+        chunks = []
+        for start in range(0, len(requests), composite_size):
+            chunk = [dict({'referenceId': 'ref{}'.format(start + idx)}, **request)
+                     for idx, request in enumerate(requests[start:start + composite_size])]
+            chunks.append(self._request('POST', self._url('composite/'), 'composite',
+                                        json={'allOrNone': all_or_none, 'compositeRequest': chunk}))
+
+        results = []
+        for response in await asyncio.gather(*chunks):
+            results.extend(response['compositeResponse'])
+        return results
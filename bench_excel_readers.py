@@ -0,0 +1,63 @@
+"""Excel reader backends on an Azul-shaped workbook: pd.read_excel against
+openpyxl streaming and calamine, each with the spec's usecols.
+
+    python bench_excel_readers.py [--rows 20000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import openpyxl as op
+import pandas as pd
+
+from parsers import OperatorParser, excel_readers
+
+
+def azul_workbook(path, n_rows, unused_columns=10):
+    wb = op.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['ac', 'data_inicio', 'hora_inicio', 'data_final', 'hora_final', 'defect', 'tempo_evento',
+               'station', 'chapter', 'status', 'defect_description', 'resolution_description'] +
+              ['notes_{}'.format(idx) for idx in range(unused_columns)])
+    start = datetime(2020, 1, 1)
+    for idx in range(n_rows):
+        begin = start + timedelta(hours=7 * idx)
+        end = begin + timedelta(hours=idx % 30, minutes=idx % 60)
+        ws.append([' PR-A{:02d}'.format(idx % 60), begin.replace(hour=0, minute=0), begin.time(),
+                   end.replace(hour=0, minute=0), end.time(), 100000 + idx,
+                   '{}:{:02d}'.format(idx % 30, idx % 60), ' VCP', '{:02d}'.format(idx % 80), 'AOG',
+                   'Defect {}\nsecond line'.format(idx), 'Replaced part {}'.format(idx)] +
+                  ['unused text {}'.format(idx)] * unused_columns)
+    wb.save(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    with open('settings/operators/azul.json') as f:
+        spec = json.load(f)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'OOS_DATA.xlsx')
+        azul_workbook(path, args.rows)
+
+        cleaned = {}
+        for engine in excel_readers:
+            operator_parser = OperatorParser('.', 'OOS_DATA', spec, engine)
+            start = time.perf_counter()
+            try:
+                excel_readers[engine](path, usecols=operator_parser.usecols)
+            except ImportError as e:
+                print('{:<20} skipped, {}'.format(engine, e))
+                continue
+            read_time = time.perf_counter() - start
+            cleaned[engine] = operator_parser.get_cleaned_df(path)
+            print('{:<20} {:.2f}s'.format(engine, read_time))
+
+    for engine, df in cleaned.items():
+        pd.testing.assert_frame_equal(df, cleaned['pandas'])
+    print('{} rows, get_cleaned_df identical for every backend'.format(args.rows))
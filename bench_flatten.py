@@ -0,0 +1,72 @@
+"""Flattening of nested query records: the old restart loop against
+SFApi._normalize_records.
+
+    python bench_flatten.py [--rows 100000]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from api import SFApi
+
+
+def _legacy_normalize(df):
+    if not isinstance(df, pd.Series):
+        df = pd.DataFrame(df)
+    df = df.apply(pd.Series)
+    if len(df) > 0:
+        df.drop(labels=['attributes'], axis=1, inplace=True, errors='ignore')
+    else:
+        df = None
+    return df
+
+
+def legacy_flatten(records):
+    # SFApi._expand_relationships before the single-pass flattener
+    df_records = _legacy_normalize(records)
+    restart = True
+    while restart:
+        restart = False
+        for col in df_records.columns:
+            if col[-3:] == '__r':
+                restart = True
+                s = _legacy_normalize(df_records[col]).add_prefix(col + '.')
+                df_records.drop(columns=[col], inplace=True)
+                df_records = pd.concat([df_records, s], axis=1, sort=False)
+    return df_records
+
+
+def make_records(n_rows):
+    # shaped like the root code associations of the export, two levels deep
+    return [{'attributes': {'type': 'RC_OOS_Association__c'},
+             'Id': 'a0{:07d}'.format(idx),
+             'Out_of_service__c': 'a1{:07d}'.format(idx),
+             'Root_Code__r': {'attributes': {'type': 'Root_Codes__c'},
+                              'Name': 'RC-{}'.format(idx % 500),
+                              'ATA__c': '{:02d}'.format(idx % 80),
+                              'Supplier__r': {'attributes': {'type': 'Supplier__c'},
+                                              'Name': 'Supplier {}'.format(idx % 40)}}}
+            for idx in range(n_rows)]
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    records = make_records(args.rows)
+    legacy, legacy_time = timed(legacy_flatten, records)
+    flat, flat_time = timed(SFApi._normalize_records, records)
+
+    pd.testing.assert_frame_equal(
+        flat[sorted(flat.columns)], legacy[sorted(legacy.columns)], check_dtype=False)
+    print('{} records, {} columns'.format(len(flat), len(flat.columns)))
+    print('restart loop:       {:.2f}s'.format(legacy_time))
+    print('_normalize_records: {:.2f}s ({:.1f}x)'.format(flat_time, legacy_time / flat_time))
@@ -0,0 +1,79 @@
+"""Helvetic Description fields: the per-field extracts and row-wise
+findall fallbacks against the single compiled pattern of helvetic.json.
+
+    python bench_helvetic_description.py [--rows 50000]
+"""
+import argparse
+import json
+import re
+import time
+
+import pandas as pd
+
+from parsers import _text_or_fallback
+
+
+def legacy_fields(df):
+    def event(s):
+        if len(s['Workorder Text'].strip()) > 0:
+            return s['Workorder Text']
+        return re.findall(r'(?:(?:Technical)|(?:AOG))\s*Event\:\s*([\s\S]+?)\;', s['Description'], re.IGNORECASE)[0]
+
+    def action(s):
+        if len(s['Workorder Action'].strip()) > 0:
+            return s['Workorder Action']
+        return re.findall(r'Solution\:\s*([\s\S]+?)\;', s['Description'], re.IGNORECASE)[0]
+
+    return pd.DataFrame({
+        'aircraft': df['Description'].str.extract(r'Aircraft\:\s*(.*?)\;', re.IGNORECASE, expand=False).str.strip(),
+        'status': df['Description'].str.extract(r'Status\:\s*(.*?)\;', re.IGNORECASE, expand=False).str.strip(),
+        'event': df[['Workorder Text', 'Description']].apply(event, axis=1),
+        'action': df[['Workorder Action', 'Description']].apply(action, axis=1),
+    })
+
+
+def compiled_fields(df, pattern):
+    description = df['Description'].str.extract(pattern)
+    return pd.DataFrame({
+        'aircraft': description['aircraft'].str.strip(),
+        'status': description['status'].str.strip(),
+        'event': _text_or_fallback(df['Workorder Text'], description['event']),
+        'action': _text_or_fallback(df['Workorder Action'], description['solution']),
+    })
+
+
+def descriptions(n_rows):
+    return pd.DataFrame({
+        'Description': ['Aircraft: HB-J{:02d}; Status: {}; {} Event: Engine {} vibration\nreported by crew; '
+                        'Solution: Replaced sensor {};'.format(
+                            idx % 40, 'Closed' if idx % 3 else 'Open', 'AOG' if idx % 2 else 'Technical', idx, idx)
+                        for idx in range(n_rows)],
+        # half the rows have their own texts, the others fall back to the description
+        'Workorder Text': ['' if idx % 2 else 'Own text {}'.format(idx) for idx in range(n_rows)],
+        'Workorder Action': ['' if idx % 2 else 'Own action {}'.format(idx) for idx in range(n_rows)],
+    })
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    with open('settings/operators/helvetic.json') as f:
+        extract = json.load(f)['extract']
+    pattern = re.compile(extract['pattern'], re.IGNORECASE if extract.get('ignore_case') else 0)
+
+    df = descriptions(args.rows)
+    legacy, legacy_time = timed(legacy_fields, df)
+    compiled, compiled_time = timed(compiled_fields, df, pattern)
+
+    pd.testing.assert_frame_equal(compiled, legacy)
+    print('{} rows'.format(args.rows))
+    print('per-field extracts: {:.2f}s'.format(legacy_time))
+    print('compiled pattern:   {:.2f}s ({:.1f}x)'.format(compiled_time, legacy_time / compiled_time))
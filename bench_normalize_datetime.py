@@ -0,0 +1,54 @@
+"""Parser._normalize_datetime against the row-wise version it replaced,
+for Excel date + time cells and for dates and times typed as text.
+
+    python bench_normalize_datetime.py [--rows 100000]
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from parsers import Parser
+
+
+def legacy_normalize_datetime(df, c_date, c_time=None):
+    def date_format(cell):
+        if isinstance(cell, datetime):
+            return datetime.strftime(cell.date(), '%Y-%m-%d')
+        return cell
+
+    dates = df[c_date].apply(date_format)
+    s = dates + ' ' + df[c_time].astype(str) if c_time is not None else dates
+    dummy_date = '2000-01-01 12:00:00'
+    s = pd.to_datetime(s.fillna(dummy_date)).apply(datetime.isoformat) + 'Z'
+    s = s.replace(datetime.isoformat(pd.to_datetime(dummy_date)) + 'Z', np.nan)
+    return s.fillna('')
+
+
+def frames(n_rows):
+    stamps = pd.Timestamp('2020-01-01') + pd.to_timedelta(np.arange(n_rows) * 7919, unit='s')
+    cells = pd.DataFrame({'date': stamps.normalize(), 'time': [stamp.time() for stamp in stamps]})
+    text = pd.DataFrame({'date': stamps.strftime('%Y-%m-%d'), 'time': stamps.strftime('%H:%M:%S')})
+    return {'date + time cells': cells, 'text date + time': text}
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    operator_parser = Parser('.', 'OOS_DATA')
+    for name, df in frames(args.rows).items():
+        legacy, legacy_time = timed(legacy_normalize_datetime, df.copy(), 'date', 'time')
+        normalized, normalized_time = timed(operator_parser._normalize_datetime, df, 'date', 'time')
+        assert normalized.tolist() == legacy.tolist()
+        print('{:<18} row-wise {:.2f}s, vectorized {:.2f}s ({:.1f}x)'.format(
+            name, legacy_time, normalized_time, legacy_time / normalized_time))
@@ -0,0 +1,171 @@
+import csv
+import io
+import time
+from collections import defaultdict, deque
+
+import pandas as pd
+from simple_salesforce.util import exception_handler
+
+from limits import limits
+from serializers import iter_csv_uploads
+
+
+class Bulk2Api:
+
+    def __init__(self, sf, poll_interval=1, max_poll_interval=30, timeout=3600):
+        self.sf = sf
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.job_ids = []
+
+    @property
+    def jobs_url(self):
+        return self.sf.base_url + 'jobs/ingest/'
+
+    def _request(self, method, url, content_type='application/json', retry_login=True, **kwargs):
+        limits.check()
+        session_id = self.sf.session_id
+        headers = {'Authorization': 'Bearer ' + session_id,
+                   'Content-Type': content_type,
+                   'Accept': 'application/json'}
+        response = self.sf.session.request(
+            method, url, headers=headers, **kwargs)
+        if response.status_code == 401 and retry_login and hasattr(self.sf, 'relogin'):
+            self.sf.relogin(session_id)
+            return self._request(method, url, content_type, False, **kwargs)
+        if response.status_code >= 300:
+            exception_handler(response, 'jobs/ingest')
+        return response
+
+    def create_job(self, obj_api, operation, external_id=None):
+        payload = {'object': obj_api, 'operation': operation,
+                   'contentType': 'CSV', 'lineEnding': 'LF'}
+        if external_id is not None:
+            payload['externalIdFieldName'] = external_id
+        return self._request('POST', self.jobs_url, json=payload).json()['id']
+
+    def upload(self, job_id, data):
+        self._request('PUT', self.jobs_url + job_id + '/batches',
+                      content_type='text/csv', data=data.encode('utf-8'))
+        self._request('PATCH', self.jobs_url + job_id,
+                      json={'state': 'UploadComplete'})
+
+    def get_job(self, job_id):
+        return self._request('GET', self.jobs_url + job_id).json()
+
+    def abort(self, job_id):
+        self._request('PATCH', self.jobs_url + job_id, json={'state': 'Aborted'})
+
+    def wait(self, job_id):
+        interval = self.poll_interval
+        deadline = time.time() + self.timeout
+        while True:
+            job = self.get_job(job_id)
+            if job['state'] in ('JobComplete', 'Failed', 'Aborted'):
+                return job
+            if time.time() > deadline:
+                raise TimeoutError(
+                    'Bulk job {} did not finish in {}s'.format(job_id, self.timeout))
+            # each poll is an API call, so polls thin out as the allowance does
+            time.sleep(limits.poll_interval(interval))
+            interval = min(interval * 1.5, self.max_poll_interval)
+
+    def iter_results(self, job_id, kind):
+        response = self._request('GET', self.jobs_url + job_id + '/' + kind + '/',
+                                 content_type='text/csv', stream=True)
+        # read as one stream, so line breaks inside quoted values stay part
+        # of their field instead of splitting the record
+        response.raw.decode_content = True
+        response.raw.auto_close = False
+        try:
+            for row in csv.DictReader(io.TextIOWrapper(response.raw, encoding='utf-8', newline='')):
+                yield row
+        finally:
+            response.close()
+
+    @staticmethod
+    def _index_rows(data):
+        reader = csv.reader(io.StringIO(data))
+        columns = next(reader)
+        positions = defaultdict(deque)
+        ids = defaultdict(deque)
+        id_idx = columns.index('Id') if 'Id' in columns else None
+        for idx, row in enumerate(reader):
+            positions[tuple(row)].append(idx)
+            if id_idx is not None:
+                ids[row[id_idx]].append(idx)
+        return columns, positions, ids
+
+    def _submit(self, obj_api, operation, df, external_id, job_ids, on_job):
+        jobs = []
+        for idx, (data, n_rows) in enumerate(iter_csv_uploads(df)):
+            # a job known from an interrupted run is collected instead of
+            # sent again, unless it never got all of its data
+            job_id = job_ids[idx] if idx < len(job_ids) else None
+            if job_id is not None and self.get_job(job_id)['state'] == 'Open':
+                self.abort(job_id)
+                job_id = None
+
+            if job_id is None:
+                # the API splits a job in batches of 10k records
+                limits.check_bulk(-(-n_rows // 10000))
+                job_id = self.create_job(obj_api, operation, external_id)
+                if on_job is not None:
+                    on_job(idx, job_id)
+                self.upload(job_id, data)
+            self.job_ids.append(job_id)
+            jobs.append((job_id, n_rows) + self._index_rows(data))
+        return jobs
+
+    @staticmethod
+    def _result(row, success):
+        if success:
+            return {'success': True, 'created': row.get('sf__Created') == 'true',
+                    'id': row.get('sf__Id'), 'errors': []}
+        return {'success': False, 'created': False, 'id': row.get('sf__Id') or None,
+                'errors': [row['sf__Error']] if 'sf__Error' in row else ['UNPROCESSED']}
+
+    @staticmethod
+    def _take(queue, results):
+        while len(queue) > 0:
+            idx = queue.popleft()
+            if results[idx] is None:
+                return idx
+        return None
+
+    def _collect(self, job_id, n_rows, columns, positions, ids):
+        # Bulk 2.0 does not keep the upload order in its result files, so
+        # rows are matched back to their position through the echoed values,
+        # or through the record Id when an update echoes them differently
+        results = [None] * n_rows
+        job = self.wait(job_id)
+        for kind, success in [('successfulResults', True), ('failedResults', False),
+                              ('unprocessedrecords', False)]:
+            for row in self.iter_results(job_id, kind):
+                result = self._result(row, success)
+                key = tuple(row.get(col, '') for col in columns)
+                idx = self._take(positions.get(key, deque()), results)
+                if idx is None:
+                    idx = self._take(ids.get(row.get('sf__Id') or row.get('Id'), deque()), results)
+                if idx is None:
+                    raise ValueError('Bulk job {} returned a {} row matching no uploaded record: {}'.format(
+                        job_id, kind, key))
+                results[idx] = result
+
+        missing = {'success': False, 'created': False, 'id': None,
+                   'errors': [job.get('errorMessage') or job['state']]}
+        results = [missing.copy() if r is None else r for r in results]
+        assert len(results) == n_rows
+        return results
+
+    def run(self, obj_api, operation, df, external_id=None, job_ids=(), on_job=None):
+        if not isinstance(df, pd.DataFrame):
+            df = pd.DataFrame(df)
+        if len(df) == 0:
+            return []
+
+        results = []
+        for job in self._submit(obj_api, operation, df, external_id, job_ids, on_job):
+            results.extend(self._collect(*job))
+        return results
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+import pandas as pd
+
+cache_dir = 'settings/parse_cache'
+max_cache_bytes = 512 * 1024 * 1024
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+
+    def __init__(self, path=cache_dir, max_bytes=max_cache_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def _entry(self, digest, parser):
+        # backends may still read a sheet differently, so each has its entries
+        return os.path.join(self.path, '{}-{}-{}-v{}.pkl'.format(
+            digest, parser.name, parser.engine, parser.version))
+
+    def get(self, digest, parser):
+        entry = self._entry(digest, parser)
+        try:
+            df = pd.read_pickle(entry)
+            # the modification time doubles as the LRU clock
+            os.utime(entry, None)
+        except (FileNotFoundError, EOFError):
+            return None
+        return df
+
+    def put(self, digest, parser, df):
+        os.makedirs(self.path, exist_ok=True)
+        entry = self._entry(digest, parser)
+        tmp_entry = '{}.{}.tmp'.format(entry, os.getpid())
+        df.to_pickle(tmp_entry)
+        os.replace(tmp_entry, entry)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                # another worker may evict the same entry meanwhile
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
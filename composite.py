@@ -0,0 +1,66 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from limits import limits
+from serializers import iter_record_chunks
+
+# records the sObject Collections resource takes per call
+collection_size = 200
+# upserts through collections need API v46.0, inserts and updates v42.0
+collections_version = '46.0'
+
+
+class CollectionsApi:
+
+    def __init__(self, sf, max_workers=4):
+        self.sf = sf
+        self.max_workers = max_workers
+
+    @property
+    def collections_url(self):
+        return 'https://{}/services/data/v{}/composite/sobjects/'.format(
+            self.sf.sf_instance, collections_version)
+
+    @staticmethod
+    def _result(row, operation):
+        if row.get('success'):
+            created = row.get('created', operation == 'insert')
+            return {'success': True, 'created': created, 'id': row.get('id'), 'errors': []}
+        # same shape as the Bulk API's sf__Error column
+        errors = ['{}:{}:{}'.format(error.get('statusCode'), error.get('message'),
+                                    ','.join(error.get('fields') or []))
+                  for error in row.get('errors', [])]
+        return {'success': False, 'created': False, 'id': row.get('id'),
+                'errors': errors or ['UNKNOWN_ERROR']}
+
+    def _send(self, obj_api, operation, records, external_id):
+        payload = {'allOrNone': False,
+                   'records': [dict({'attributes': {'type': obj_api}}, **record) for record in records]}
+        if operation == 'insert':
+            method, url = 'POST', self.collections_url
+        elif operation == 'update':
+            method, url = 'PATCH', self.collections_url
+        else:
+            method, url = 'PATCH', self.collections_url + '{}/{}'.format(obj_api, external_id)
+
+        limits.check()
+        response = self.sf._call_salesforce(method, url, name='composite/sobjects',
+                                            data=json.dumps(payload, default=str))
+        return [self._result(row, operation) for row in response.json()]
+
+    def run(self, obj_api, operation, df, external_id=None):
+        if not isinstance(df, pd.DataFrame):
+            df = pd.DataFrame(df)
+        if len(df) == 0:
+            return []
+
+        chunks = list(iter_record_chunks(df, collection_size))
+        with ThreadPoolExecutor(max_workers=limits.workers(self.max_workers)) as executor:
+            responses = executor.map(
+                lambda records: self._send(obj_api, operation, records, external_id), chunks)
+            results = []
+            for response in responses:
+                results.extend(response)
+        return results
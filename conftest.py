@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from simple_salesforce import Salesforce
+
+from api import SFApi
+
+
+class FakeSalesforce:
+    """Local HTTP server answering Salesforce REST calls from registered routes.
+
+    A route is a callable taking the request (method, path, query, body)
+    and returning (status, content_type, body); everything received is
+    kept in ``requests`` for the tests to inspect.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                request = {'method': self.command, 'path': url.path, 'query': parse_qs(url.query),
+                           'headers': dict(self.headers), 'body': self.rfile.read(length),
+                           'time': time.monotonic()}
+                fake.requests.append(request)
+                route = fake.routes.get((self.command, url.path))
+                if route is None:
+                    status, content_type, body = 404, 'application/json', [
+                        {'errorCode': 'NOT_FOUND', 'message': url.path}]
+                else:
+                    status, content_type, body = route(request)
+                if not isinstance(body, (bytes, str)):
+                    body = json.dumps(body)
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.instance = '127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def route(self, method, path, handler):
+        self.routes[(method, '/services/data/v42.0/' + path)] = handler
+
+    def paths(self, method=None):
+        return [r['path'] for r in self.requests if method is None or r['method'] == method]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PlainHttpAdapter(HTTPAdapter):
+    # simple_salesforce always builds https urls; the fake only speaks http
+    def send(self, request, **kwargs):
+        request.url = 'http://' + request.url[len('https://'):]
+        return super().send(request, **kwargs)
+
+
+@pytest.fixture
+def fake_salesforce():
+    fake = FakeSalesforce()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def sf(fake_salesforce):
+    session = requests.Session()
+    session.mount('https://', PlainHttpAdapter())
+    return Salesforce(session_id='SESSION', instance=fake_salesforce.instance, session=session)
+
+
+@pytest.fixture
+def sf_api(sf):
+    sf_api = SFApi()
+    sf_api.sf = sf
+    return sf_api
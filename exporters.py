@@ -0,0 +1,143 @@
+import re
+
+import openpyxl as op
+import pandas as pd
+
+# Salesforce field type -> pyarrow type factory; other fields are text
+arrow_types = {
+    'boolean': 'bool_',
+    'double': 'float64',
+    'percent': 'float64',
+    'currency': 'float64',
+    'int': 'float64',
+}
+
+
+def order_columns(columns, moved, before):
+    # places the moved columns, in order, right before another column
+    columns = [col for col in columns if col not in moved]
+    idx = columns.index(before)
+    return columns[:idx] + list(moved) + columns[idx:]
+
+
+def is_id_column(col):
+    return re.search(r'(id)$', col, re.IGNORECASE) is not None
+
+
+def _rows(chunk):
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+
+class XlsxWriter:
+
+    def __init__(self, fname, columns, hidden=(), types=None):
+        self.fname = fname
+        # write-only workbooks keep nothing but the current row in memory
+        self.wb = op.Workbook(write_only=True)
+        self.ws = self.wb.create_sheet()
+        for idx, col in enumerate(columns):
+            if col in hidden:
+                self.ws.column_dimensions[op.utils.get_column_letter(idx + 1)].hidden = True
+        self.ws.append(columns)
+
+    def write(self, chunk):
+        for row in _rows(chunk):
+            self.ws.append(row)
+
+    def close(self):
+        self.wb.save(self.fname)
+
+
+class CsvWriter:
+
+    def __init__(self, fname, columns, hidden=(), types=None):
+        self.f = open(fname, 'w', newline='', encoding='utf-8')
+        # the header goes out even when no chunk follows
+        pd.DataFrame(columns=columns).to_csv(self.f, index=False)
+
+    def write(self, chunk):
+        chunk.to_csv(self.f, index=False, header=False)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetWriter:
+
+    def __init__(self, fname, columns, hidden=(), types=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError('parquet exports need pyarrow installed')
+        self.fname = fname
+        self.columns = columns
+        self.types = {} if types is None else types
+        self.writer = None
+        self.schema = None
+
+    def _schema(self, chunk):
+        import pyarrow as pa
+
+        # known Salesforce types decide; the others are inferred from the
+        # first chunk, with all-empty columns typed as text
+        fields = []
+        for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+            if field.name in self.types:
+                field = pa.field(field.name, getattr(pa, arrow_types.get(self.types[field.name], 'string'))())
+            elif field.type == pa.null():
+                field = pa.field(field.name, pa.string())
+            fields.append(field)
+        return pa.schema(fields)
+
+    @staticmethod
+    def _array(s, arrow_type):
+        import pyarrow as pa
+
+        try:
+            return pa.array(s, type=arrow_type, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        # values that don't fit the schema of the first chunk are converted
+        # to it, as text, numbers or flags; anything else is left empty
+        if pa.types.is_string(arrow_type):
+            s = s.astype(object).where(s.isna(), s.astype(str))
+        elif pa.types.is_boolean(arrow_type):
+            s = s.map({True: True, False: False, 'true': True, 'false': False,
+                       'True': True, 'False': False})
+        else:
+            s = pd.to_numeric(s, errors='coerce')
+        return pa.array(s, type=arrow_type, from_pandas=True)
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            self.schema = self._schema(chunk)
+            self.writer = pq.ParquetWriter(self.fname, self.schema)
+        self.writer.write_table(pa.Table.from_arrays(
+            [self._array(chunk[field.name], field.type) for field in self.schema], schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # an export without rows still gets a file with its columns
+            self.write(pd.DataFrame(columns=self.columns))
+        self.writer.close()
+
+
+export_writers = {
+    'xlsx': XlsxWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def write_chunks(fname, chunks, columns, fmt='xlsx', hidden=(), types=None):
+    writer = export_writers[fmt](fname, columns, hidden, types)
+    try:
+        for chunk in chunks:
+            writer.write(chunk.reindex(columns=columns))
+    finally:
+        writer.close()
+    return fname
@@ -0,0 +1,105 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+history_db = 'settings/history.db'
+legacy_history = 'settings/history_files.txt'
+
+
+def normalize_path(path):
+    return path.replace('ø', 'o').replace('@', 'a')
+
+
+class HistoryStore:
+
+    def __init__(self, path=history_db, legacy_path=legacy_history):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                hash TEXT,
+                mtime REAL,
+                parser TEXT,
+                upload_status TEXT,
+                job_id TEXT,
+                processed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        self._migrate(legacy_path)
+
+    def _migrate(self, legacy_path):
+        done = self.conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone()
+        if done is not None or not os.path.isfile(legacy_path):
+            return
+
+        with open(legacy_path, 'r') as f:
+            paths = [path for path in f.read().split('\n') if path]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO files (path, upload_status) VALUES (?, 'uploaded')",
+                [(path,) for path in paths])
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('legacy_migrated', ?)", (legacy_path,))
+
+    def contains(self, path):
+        return self.conn.execute(
+            "SELECT 1 FROM files WHERE path = ? AND upload_status != 'failed'",
+            (normalize_path(path),)).fetchone() is not None
+
+    def find_hash(self, digest):
+        row = self.conn.execute(
+            "SELECT path FROM files WHERE hash = ? AND upload_status != 'failed'", (digest,)).fetchone()
+        return None if row is None else row[0]
+
+    def record(self, path, digest=None, parser=None, upload_status='uploaded', job_id=None):
+        mtime = os.path.getmtime(path) if os.path.isfile(path) else None
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (normalize_path(path), digest, mtime, parser, upload_status, job_id,
+                 datetime.now().isoformat()))
+
+    def close(self):
+        self.conn.close()
+
+
+class ScanSnapshot:
+
+    def __init__(self, path=history_db):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_snapshot (
+                dir TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                files TEXT,
+                subdirs TEXT
+            )
+        ''')
+        self.dirs = {}
+        for dirname, mtime_ns, files, subdirs in self.conn.execute('SELECT * FROM scan_snapshot'):
+            self.dirs[dirname] = (mtime_ns, json.loads(files), json.loads(subdirs))
+        self.changed = {}
+
+    def get(self, dirname, mtime_ns):
+        entry = self.dirs.get(dirname)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, dirname, mtime_ns, files, subdirs):
+        self.dirs[dirname] = self.changed[dirname] = (mtime_ns, files, subdirs)
+
+    def save(self):
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO scan_snapshot VALUES (?, ?, ?, ?)',
+                [(dirname, mtime_ns, json.dumps(files), json.dumps(subdirs))
+                 for dirname, (mtime_ns, files, subdirs) in self.changed.items()])
+        self.changed = {}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import requests
+from simple_salesforce import SalesforceGeneralError
+
+from bulk import Bulk2Api
+from composite import CollectionsApi, collection_size
+from history import history_db
+from limits import limits
+
+runs_dir = 'settings/upload_runs'
+checkpoint_rows = 10000
+
+# failures worth another try; a chunk is retried from its journal entry,
+# so whatever already reached Salesforce is not sent twice
+retryable_errors = (requests.ConnectionError, requests.Timeout,
+                    SalesforceGeneralError, TimeoutError)
+
+
+class UploadJournal:
+
+    def __init__(self, path=history_db, data_dir=runs_dir):
+        self.data_dir = data_dir
+        # stages of one upload write their chunks from several threads
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS upload_runs (
+                run_id TEXT PRIMARY KEY,
+                kind TEXT,
+                state TEXT,
+                meta TEXT,
+                created_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS upload_chunks (
+                run_id TEXT,
+                chunk_id TEXT,
+                chunk_hash TEXT,
+                job_ids TEXT,
+                state TEXT,
+                results TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (run_id, chunk_id)
+            );
+        ''')
+
+    def _data_path(self, run_id):
+        return os.path.join(self.data_dir, run_id + '.pkl')
+
+    def start(self, kind, df=None, meta=None):
+        run_id = uuid.uuid4().hex
+        # the prepared data is kept so a resumed run needn't parse again
+        if df is not None:
+            os.makedirs(self.data_dir, exist_ok=True)
+            df.to_pickle(self._data_path(run_id))
+        with self.conn:
+            self.conn.execute('INSERT INTO upload_runs VALUES (?, ?, ?, ?, ?)',
+                              (run_id, kind, 'running', json.dumps(meta), datetime.now().isoformat()))
+        return run_id
+
+    def open_runs(self, kind):
+        return [run_id for run_id, in self.conn.execute(
+            "SELECT run_id FROM upload_runs WHERE kind = ? AND state = 'running' ORDER BY created_at",
+            (kind,))]
+
+    def load(self, run_id):
+        meta, = self.conn.execute('SELECT meta FROM upload_runs WHERE run_id = ?', (run_id,)).fetchone()
+        df = None
+        if os.path.isfile(self._data_path(run_id)):
+            df = pd.read_pickle(self._data_path(run_id))
+        return df, json.loads(meta)
+
+    def finish(self, run_id, state='done'):
+        # 'failed' and 'abandoned' runs are closed the same way, they just
+        # won't be offered to --resume any more
+        with self.conn:
+            self.conn.execute('UPDATE upload_runs SET state = ? WHERE run_id = ?', (state, run_id))
+        if os.path.isfile(self._data_path(run_id)):
+            os.remove(self._data_path(run_id))
+
+    def chunk(self, run_id, chunk_id):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT chunk_hash, job_ids, state, results FROM upload_chunks WHERE run_id = ? AND chunk_id = ?',
+                (run_id, chunk_id)).fetchone()
+        if row is None:
+            return None
+        return {'chunk_hash': row[0], 'job_ids': json.loads(row[1]), 'state': row[2],
+                'results': None if row[3] is None else json.loads(row[3])}
+
+    def save_chunk(self, run_id, chunk_id, chunk_hash, job_ids, state, results=None):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO upload_chunks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (run_id, chunk_id, chunk_hash, json.dumps(job_ids), state,
+                               None if results is None else json.dumps(results), datetime.now().isoformat()))
+
+    def job_ids(self, run_id):
+        job_ids = []
+        for ids, in self.conn.execute(
+                'SELECT job_ids FROM upload_chunks WHERE run_id = ? ORDER BY rowid', (run_id,)):
+            job_ids.extend(json.loads(ids))
+        return job_ids
+
+    def close(self):
+        self.conn.close()
+
+
+def chunk_hash(df):
+    return hashlib.sha1(df.to_csv(index=False).encode('utf-8')).hexdigest()
+
+
+def _insert_calls(sf_api, journal, run_id, chunk_id, obj_api, chunk):
+    # small inserts go through sObject Collections one call at a time, each
+    # journaled on its own, so an interruption leaves a single call in doubt
+    results = []
+    for start in range(0, len(chunk), collection_size):
+        piece = chunk.iloc[start:start + collection_size]
+        call_id = '{}:{}'.format(chunk_id, start // collection_size)
+        entry = journal.chunk(run_id, call_id)
+        if entry is None:
+            journal.save_chunk(run_id, call_id, chunk_hash(piece), [], 'pending')
+            call_results = CollectionsApi(sf_api.sf).run(obj_api, 'insert', piece)
+            journal.save_chunk(run_id, call_id, chunk_hash(piece), [], 'done', call_results)
+        elif entry['state'] == 'done':
+            call_results = entry['results']
+        else:
+            # the call may or may not have reached Salesforce; sending it
+            # again could insert its records twice, so they are reported
+            call_results = [{'success': False, 'created': False, 'id': None,
+                             'errors': ['INTERRUPTED:the upload stopped while this record was sent, '
+                                        'check whether it was inserted:']} for _ in range(len(piece))]
+        results.extend(call_results)
+    return results
+
+
+def write_checkpointed(sf_api, journal, run_id, obj_api, operation, df, external_id=None,
+                       chunk_rows=checkpoint_rows, retries=3, backoff=5):
+    results = []
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        chunk_id = '{}:{}:{}'.format(obj_api, operation, start // chunk_rows)
+        digest = chunk_hash(chunk)
+        entry = journal.chunk(run_id, chunk_id)
+        if entry is not None and entry['chunk_hash'] != digest:
+            raise ValueError('chunk {} of run {} no longer matches its journal entry'.format(chunk_id, run_id))
+        if entry is not None and entry['state'] == 'done':
+            results.extend(entry['results'])
+            continue
+
+        job_ids = [] if entry is None else entry['job_ids']
+        if operation == 'insert' and len(job_ids) == 0:
+            # the path a resumed chunk took is kept, whatever the limits say now
+            limits.refresh_if_stale(sf_api.sf)
+            by_calls = (journal.chunk(run_id, chunk_id + ':0') is not None
+                        or not limits.prefer_bulk(len(chunk), sf_api.collections_threshold))
+        else:
+            by_calls = False
+
+        for attempt in range(retries + 1):
+            try:
+                journal.save_chunk(run_id, chunk_id, digest, job_ids, 'pending')
+                if by_calls:
+                    chunk_results = _insert_calls(sf_api, journal, run_id, chunk_id, obj_api, chunk)
+                elif operation == 'insert':
+                    # inserts aren't idempotent, so a Bulk job's id is
+                    # journaled before any data is sent
+                    def on_job(idx, job_id):
+                        job_ids[idx:idx + 1] = [job_id]
+                        journal.save_chunk(run_id, chunk_id, digest, job_ids, 'submitted')
+
+                    chunk_results = Bulk2Api(sf_api.sf).run(
+                        obj_api, operation, chunk, external_id, job_ids, on_job)
+                else:
+                    # updates and upserts can simply be sent again, so they
+                    # keep the adaptive path and no job ids are tracked
+                    chunk_results = sf_api._bulk(obj_api, operation, chunk, external_id)
+                break
+            except retryable_errors:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+
+        journal.save_chunk(run_id, chunk_id, digest, job_ids, 'done', chunk_results)
+        results.extend(chunk_results)
+    return results
@@ -0,0 +1,132 @@
+import re
+import threading
+import time
+
+from simple_salesforce.exceptions import SalesforceError
+
+# below this share of the daily allowance calls slow down and fan out less
+low_watermark = 0.2
+# this share is left for the org's other integrations; nothing here uses it
+reserve = 0.05
+# how often the /limits resource is read again, header updates aside
+refresh_interval = 300
+
+
+class LimitReserveError(Exception):
+    pass
+
+
+class LimitTracker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.api_used = None
+        self.api_max = None
+        self.bulk_batches_remaining = None
+        self.bulk_batches_max = None
+        self.refreshed_at = None
+        self.throttled = 0
+
+    def observe(self, response, *args, **kwargs):
+        # requests response hook, fed by every call on the shared session
+        info = response.headers.get('Sforce-Limit-Info')
+        if info:
+            match = re.search(r'api-usage=(\d+)/(\d+)', info)
+            if match is not None:
+                with self.lock:
+                    self.api_used, self.api_max = int(match.group(1)), int(match.group(2))
+        return response
+
+    def refresh(self, sf):
+        try:
+            limits = sf.limits()
+        except SalesforceError:
+            # /limits needs View Setup and Configuration, which integration
+            # users often lack; the Sforce-Limit-Info headers still count
+            # API calls, and the resource isn't asked again every call
+            with self.lock:
+                self.refreshed_at = time.time()
+            return
+        with self.lock:
+            api = limits.get('DailyApiRequests', {})
+            if 'Max' in api:
+                self.api_max = api['Max']
+                self.api_used = api['Max'] - api['Remaining']
+            batches = limits.get('DailyBulkApiBatches', {})
+            if 'Max' in batches:
+                self.bulk_batches_max = batches['Max']
+                self.bulk_batches_remaining = batches['Remaining']
+            self.refreshed_at = time.time()
+
+    def refresh_if_stale(self, sf):
+        if self.refreshed_at is None or time.time() - self.refreshed_at > refresh_interval:
+            self.refresh(sf)
+
+    def api_left(self):
+        if self.api_max is None or self.api_max == 0:
+            return 1.0
+        return max(self.api_max - self.api_used, 0) / self.api_max
+
+    def bulk_left(self):
+        if self.bulk_batches_max is None or self.bulk_batches_max == 0:
+            return 1.0
+        return self.bulk_batches_remaining / self.bulk_batches_max
+
+    def check(self, n_calls=1):
+        left = self.api_left()
+        if self.api_max is not None and left < reserve:
+            raise LimitReserveError(
+                'daily API requests at {}/{}, the last {:.0%} are kept for other integrations'.format(
+                    self.api_used, self.api_max, reserve))
+        if left < low_watermark:
+            with self.lock:
+                self.throttled += n_calls
+            # the closer to the reserve, the longer each call waits
+            time.sleep(n_calls * (low_watermark - left) / low_watermark)
+
+    def check_bulk(self, n_batches=1):
+        if self.bulk_batches_max is not None and \
+                self.bulk_batches_remaining - n_batches < reserve * self.bulk_batches_max:
+            raise LimitReserveError(
+                'daily Bulk API batches at {} left of {}, the last {:.0%} are kept for other integrations'.format(
+                    self.bulk_batches_remaining, self.bulk_batches_max, reserve))
+
+    def workers(self, max_workers):
+        # concurrency shrinks linearly below the low watermark
+        left = self.api_left()
+        if left >= low_watermark:
+            return max_workers
+        return max(1, int(max_workers * left / low_watermark))
+
+    def poll_interval(self, interval):
+        left = self.api_left()
+        if left >= low_watermark:
+            return interval
+        return interval * low_watermark / max(left, reserve)
+
+    def prefer_bulk(self, n_rows, threshold):
+        # collections cost one API call per 200 rows, a Bulk job a handful
+        # of calls plus one batch per 10k rows; whichever allowance is
+        # scarcer decides where the line between the two goes
+        api_left = self.api_left()
+        bulk_left = self.bulk_left()
+        if api_left < low_watermark and bulk_left > api_left:
+            threshold = min(threshold, 200)
+        elif bulk_left < low_watermark and api_left > bulk_left:
+            threshold = max(threshold, 10000)
+        return n_rows > threshold
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'api_used': self.api_used,
+                'api_max': self.api_max,
+                'api_left': round(self.api_left(), 4),
+                'bulk_batches_remaining': self.bulk_batches_remaining,
+                'bulk_batches_max': self.bulk_batches_max,
+                'throttled_calls': self.throttled,
+                'refreshed_at': self.refreshed_at,
+            }
+
+
+limits = LimitTracker()
@@ -1,76 +1,319 @@
 import pandas as pd
 import numpy as np
+import openpyxl as op
 import os
-from datetime import datetime
+from datetime import date, datetime
+import json
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from pandas.io.parsers import TextParser
+
+from cache import file_hash
+from history import HistoryStore
+
+
+operators_dir = 'settings/operators'
+
+
+def _hours_minutes(s):
+    parts = s.str.split(':', expand=True)
+    if parts.shape[1] < 2:
+        return s
+    hours = pd.to_numeric(parts[0], errors='coerce') + \
+        pd.to_numeric(parts[1], errors='coerce') / 60
+    return hours.where(parts[1].notna(), s)
+
+
+def _month_hours(s):
+    date = pd.to_datetime(s, errors='coerce')
+    return ((date.dt.month - 1) * 31 * 24) + (date.dt.day * 24) + date.dt.hour + (date.dt.minute / 60)
+
+
+def _percent(s):
+    s = pd.to_numeric(s, errors='coerce')
+    return s.where(s > 1, s * 100).fillna('').astype(str)
+
+
+transforms = {
+    'strip': lambda s: s.str.strip(),
+    'br': lambda s: s.str.replace('\n', '<br>', regex=False),
+    'str': lambda s: s.astype(str),
+    'int': lambda s: s.astype(int),
+    'float': lambda s: s.astype(float),
+    'positive': lambda s: s.where(s > 0),
+    'ensure_prefix': lambda s, start, prefix: s.where(s.str.startswith(start), prefix + s.str.strip()),
+    'hours_minutes': _hours_minutes,
+    'month_hours': _month_hours,
+    'percent': _percent,
+}
+
+
+def _text_or_fallback(text, fallback):
+    has_text = text.astype(str).str.strip().str.len() > 0
+    return text.where(has_text, fallback.fillna(''))
+
+
+def _find_header(df, first_column):
+    if df.columns[0] == first_column:
+        return df
+
+    is_header = (df.iloc[:, 0] == first_column).to_numpy()
+    if not is_header.any():
+        raise ValueError('{} header row not found'.format(first_column))
+    header_row = is_header.argmax()
+    body = df.iloc[header_row + 1:].reset_index(drop=True)
+    body.columns = df.iloc[header_row].to_numpy()
+    return body
+
+
+def _spread_category_rows(df, key, category, value, comment):
+    df = df.replace(r'^\s*$', np.nan, regex=True)
+
+    # each record is one key row followed by one row per extra category, so
+    # a running count of key rows ties every category row to its record
+    record = df[key].notna().cumsum()
+    categories = df[[category, value, comment]].assign(
+        record=record)[record > 0].dropna(subset=[category])
+
+    values = categories.groupby(['record', category])[value].first().unstack()
+    comments = categories.dropna(subset=[comment]).sort_values(
+        by=['record', category], kind='mergesort')
+    comments = comments[comment].astype(str).groupby(
+        comments['record']).agg('<br>'.join)
+
+    is_record = df[key].notna()
+    records = record[is_record]
+    df = df[is_record].drop(
+        columns=[category, value, comment]).reset_index(drop=True)
+    for name in values.columns:
+        df[name] = values[name].reindex(records).to_numpy()
+    df[comment] = comments.reindex(records).fillna('').to_numpy()
+    return df
+
+
+def _frame_from_rows(rows, converters=None, dtype=None, usecols=None):
+    # cells go through the TextParser pd.read_excel uses, so every backend
+    # infers types the same way ('05' becoming 5, 'NA' becoming NaN, ...)
+    data = []
+    last_filled = 0
+    width = 0
+    for row in rows:
+        row = ['' if value is None else value for value in row]
+        filled = [i for i, value in enumerate(row) if value != '']
+        data.append(row)
+        # read-only sheets often report formatted but empty trailing cells
+        if len(filled) > 0:
+            last_filled = len(data)
+            width = max(width, filled[-1] + 1)
+    if last_filled == 0:
+        return pd.DataFrame()
+    data = [row[:width] + [''] * (width - len(row)) for row in data[:last_filled]]
+
+    parser = TextParser(data, header=0, converters=converters, dtype=dtype,
+                        usecols=usecols, skip_blank_lines=False)
+    try:
+        return parser.read()
+    finally:
+        parser.close()
+
+
+def read_excel_pandas(path, converters=None, dtype=None, usecols=None):
+    return pd.read_excel(path, converters=converters, dtype=dtype, usecols=usecols)
+
+
+def read_excel_openpyxl_streaming(path, converters=None, dtype=None, usecols=None):
+    workbook = op.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        return _frame_from_rows(rows, converters, dtype, usecols)
+    finally:
+        workbook.close()
+
+
+def _calamine_value(value):
+    # match what openpyxl hands to pandas: whole floats as int, dates as datetime
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if type(value) is date:
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def read_excel_calamine(path, converters=None, dtype=None, usecols=None):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(path)
+    rows = workbook.get_sheet_by_index(0).to_python(skip_empty_area=False)
+    return _frame_from_rows((list(map(_calamine_value, row)) for row in rows),
+                            converters, dtype, usecols)
+
+
+excel_readers = {
+    'pandas': read_excel_pandas,
+    'openpyxl_streaming': read_excel_openpyxl_streaming,
+    'calamine': read_excel_calamine,
+}
+
+
+def _parse_file(job, cache=None):
+    parser, fname = job
+    try:
+        digest = file_hash(fname)
+        return fname, digest, parser.parse(fname, cache, digest), None
+    except Exception as e:
+        return fname, None, None, '{}: {}'.format(type(e).__name__, e)
+
+
+def parse_files(jobs, workers=None, cache=None):
+    if workers == 1:
+        return [_parse_file(job, cache) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_file, jobs, repeat(cache)))
 
 
 class Parser:
 
-    def __init__(self, path, file_pattern):
+    # bump whenever get_cleaned_df output changes, so cached parses of
+    # older versions are not reused
+    version = 3
+    # columns get_cleaned_df reads; None loads the whole sheet
+    usecols = None
+    # layout of dates and times typed as text, tried before inference
+    date_format = '%Y-%m-%d'
+    time_format = '%H:%M:%S'
+
+    def __init__(self, path, file_pattern, engine='pandas'):
         self.path = path
         self.file_pattern = file_pattern
+        self.engine = engine
+        self.name = type(self).__name__
 
-    def get_list_files(self):
+    @staticmethod
+    def _list_dir(root, snapshot):
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            return [], []
+
+        # a directory whose mtime did not move has the same entries, so the
+        # (slow, on network shares) listing is replayed from the snapshot
+        cached = None if snapshot is None else snapshot.get(root, mtime_ns)
+        if cached is not None:
+            return cached
+
+        fnames = []
+        dirnames = []
+        # like os.walk, unreadable directories are skipped and links to
+        # directories aren't followed
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirnames.append(entry.name)
+                    elif entry.is_file():
+                        fnames.append(entry.name)
+        except OSError:
+            return [], []
+        if snapshot is not None:
+            snapshot.put(root, mtime_ns, fnames, dirnames)
+        return fnames, dirnames
+
+    def get_list_files(self, snapshot=None):
         cleaned_path = []
-        for root, dirname, fnames in os.walk(self.path):
+        roots = [self.path]
+        while len(roots) > 0:
+            root = roots.pop()
+            fnames, dirnames = self._list_dir(root, snapshot)
             for fname in fnames:
                 if fname.upper().startswith(self.file_pattern):
                     cleaned_path.append(
                         (root + '/' + fname).replace('\\', '/'))
+            roots.extend(root + '/' + dirname for dirname in reversed(dirnames))
 
+        if snapshot is not None:
+            snapshot.save()
         return cleaned_path
 
+    def watch(self, interval=60, snapshot=None):
+        known = set(self.get_list_files(snapshot))
+        while True:
+            time.sleep(interval)
+            for path in self.get_list_files(snapshot):
+                if path not in known:
+                    known.add(path)
+                    yield path
+
     @staticmethod
-    def _date_format_f(cell):
-        if isinstance(cell, datetime):
-            return datetime.strftime(cell.date(), '%Y-%m-%d')
-        return cell
+    def _to_datetime(s, fmt=None):
+        parsed = pd.to_datetime(s, format=fmt, errors='coerce')
+        # cells typed in some other layout fall back to per-cell inference
+        retry = parsed.isna() & s.notna()
+        if fmt is not None and retry.any():
+            parsed[retry] = pd.to_datetime(s[retry], errors='coerce')
+        return parsed
 
     def _normalize_datetime(self, df, c_date, c_time=None):
-        df[c_date] = df[c_date].apply(self._date_format_f)
-
-        if c_time is not None:
-            df[c_time] = df[c_time].astype(str)
-            s = (df[c_date] + ' ' + df[c_time])
+        dates = df[c_date]
+        if pd.api.types.is_datetime64_any_dtype(dates):
+            stamps = dates.dt.normalize()
         else:
-            s = df[c_date]
-
-        dummy_date = '2000-01-01 12:00:00'
-        s = pd.to_datetime(s.fillna(dummy_date)).apply(
-            datetime.isoformat) + 'Z'
-        s = s.replace(datetime.isoformat(
-            pd.to_datetime(dummy_date)) + 'Z', np.nan)
+            # real date cells only count for their day, typed text is parsed whole
+            is_text = dates.str.len().notna() if dates.dtype == object else dates.isna() & False
+            stamps = self._to_datetime(dates.where(is_text), self.date_format)
+            cell_dates = pd.to_datetime(dates.where(~is_text), errors='coerce')
+            stamps = stamps.fillna(cell_dates.dt.normalize())
 
-        return s.fillna('')
-
-    def _get_oos_from_dates(self, df):
-        start_date = pd.to_datetime(df['Start_Date__c'].str[:-1])
-        release_date = pd.to_datetime(df['Release_Date__c'].str[:-1])
+        if c_time is not None:
+            times = df[c_time]
+            if pd.api.types.is_datetime64_any_dtype(times):
+                offsets = times - times.dt.normalize()
+            else:
+                times = '1900-01-01 ' + times.astype(str).where(times.notna())
+                times = self._to_datetime(
+                    times, '%Y-%m-%d ' + self.time_format)
+                offsets = times - pd.Timestamp('1900-01-01')
+            stamps = stamps.dt.normalize() + offsets
+
+        # numpy formats ISO-8601 in C, far quicker than dt.strftime
+        iso = np.datetime_as_string(
+            stamps.dt.round('s').to_numpy(dtype='datetime64[s]'), unit='s')
+        return (pd.Series(iso, index=stamps.index, dtype=object) + 'Z').where(stamps.notna(), '')
+
+    def _get_oos_from_dates(self, df, c_start='Start_Date__c', c_release='Release_Date__c'):
+        start_date = pd.to_datetime(df[c_start].str[:-1])
+        release_date = pd.to_datetime(df[c_release].str[:-1])
         return (release_date - start_date) / np.timedelta64(1, 'h')
 
-    def get_unprocessed_files(self):
-        need_analysis = []
-        paths = self.get_list_files()
-
-        if os.path.isfile('settings/history_files.txt'):
-            with open('settings/history_files.txt', 'r') as f:
-                history_paths = f.read().split('\n')
-
-            for path in paths:
-                if path.replace('ø', 'o').replace('@', 'a') not in history_paths:
-                    need_analysis.append(path)
-        else:
-            need_analysis = paths
-
-        return need_analysis
+    def get_unprocessed_files(self, history=None, snapshot=None):
+        if history is None:
+            history = HistoryStore()
+        return [path for path in self.get_list_files(snapshot) if not history.contains(path)]
 
     def load_file(self, path, converters=None, dtype=None):
-        return pd.read_excel(path, converters=converters, dtype=dtype)
+        return excel_readers[self.engine](path, converters=converters, dtype=dtype, usecols=self.usecols)
 
     def get_cleaned_df(self, fname):
         raise NotImplementedError
 
+    def parse(self, fname, cache=None, digest=None):
+        if cache is None:
+            return self.get_cleaned_df(fname)
+
+        if digest is None:
+            digest = file_hash(fname)
+        df = cache.get(digest, self)
+        if df is None:
+            df = self.get_cleaned_df(fname)
+            cache.put(digest, self, df)
+        elif 'Reference_Date__c' in df.columns:
+            # the reference date comes from the folder, not the content
+            df['Reference_Date__c'] = self.get_reference_date(fname, len(df))
+        return df
+
     def get_reference_date(self, fname, length):
         month = None
         year = None
@@ -84,237 +327,130 @@ class Parser:
         return length * ['{}-{}-{}'.format(year, month, '01')]
 
 
-class AzulParser(Parser):
-
-    def __init__(self, root, file_pattern):
-        self.root = root
-        self.azul_path = '/5 - LATIN AMERICA/AZUL'
-        super(AzulParser, self).__init__(
-            self.root + self.azul_path, file_pattern)
-
-    @staticmethod
-    def _normalize_oos_time(cell):
-        cell_splitted = cell.split(':')
-        if len(cell_splitted) > 1:
-            return float(cell_splitted[0]) + float(cell_splitted[1]) / 60
-        return cell
-
-    def get_cleaned_df(self, fname):
-
-        df = self.load_file(fname)
-        cleaned_df = pd.DataFrame()
-        cleaned_df['Aircraft_Register__c'] = df['ac'].str.strip()
-        cleaned_df['Start_Date__c'] = self._normalize_datetime(
-            df, 'data_inicio', 'hora_inicio')
-        cleaned_df['Release_Date__c'] = self._normalize_datetime(
-            df, 'data_final', 'hora_final')
-
-        df.fillna('', inplace=True)
-
-        cleaned_df['Log_Number__c'] = df['defect'].astype(int)
-        cleaned_df['OOS_Total_Time__c'] = df['tempo_evento'].astype(
-            str).str.strip().apply(self._normalize_oos_time)
-        cleaned_df['Station__c'] = df['station'].str.strip()
-        cleaned_df['Operator_ATA_Chapter__c'] = df['chapter']
-        cleaned_df['Event_Record_Identifier__c'] = df['status'].fillna(
-            '').str.strip()
-        cleaned_df['Event_Description__c'] = df['defect_description'].str.replace(
-            '\n', '<br>')
-        cleaned_df['Action_Description__c'] = df['resolution_description'].str.replace(
-            '\n', '<br>')
-        cleaned_df['Reference_Date__c'] = self.get_reference_date(
-            fname, len(cleaned_df))
+class OperatorParser(Parser):
 
-        return cleaned_df
-
-
-class WideroeParser(Parser):
-
-    def __init__(self, root, file_pattern):
-        self.root = root
-        self.wideroe_path = '/4 - EMEA/WIDEROE'
-        super(WideroeParser, self).__init__(
-            self.root + self.wideroe_path, file_pattern)
-
-    def get_cleaned_df(self, fname):
-        converters = {
-            'aircraft': (lambda x: x if x.startswith('LN') else 'LN-' + x.strip())}
-        df = self.load_file(fname, converters=converters)
-
-        cleaned_df = pd.DataFrame()
-        cleaned_df['Aircraft_Register__c'] = df['aircraft']
-        cleaned_df['Start_Date__c'] = self._normalize_datetime(
-            df, 'OOS_Start_Date_And_Time')
-        cleaned_df['Release_Date__c'] = self._normalize_datetime(
-            df, 'OOS_End_Date_And_Time')
-
-        df.fillna('', inplace=True)
-
-        cleaned_df['Log_Number__c'] = df['Workordernumber'].astype(
-            int)
-        cleaned_df['OOS_Total_Time__c'] = df['OOS_Total_Hrs_Downtime'].astype(
-            float)
-        cleaned_df['Station__c'] = df['station'].str.strip()
-        cleaned_df['Operator_ATA_Chapter__c'] = df['workorder_ATA']
-        cleaned_df['Event_Record_Identifier__c'] = df['OPS_CODE'].str.strip()
-        cleaned_df['Event_Description__c'] = df['Workorder_Desc_text'].str.replace(
-            '\n', '<br>')
-        cleaned_df['Action_Description__c'] = df['Workorder_Action_text'].str.replace(
-            '\n', '<br>')
-        cleaned_df['Header__c'] = df['event_header']
-        cleaned_df['Flight_Number__c'] = df['FlightNumber'].astype(str)
-        cleaned_df['Reference_Date__c'] = self.get_reference_date(
-            fname, len(cleaned_df))
-
-        return cleaned_df
-
-
-class HelveticParser(Parser):
-
-    def __init__(self, root, file_pattern):
-        self.root = root
-        self.helvetic_path = '/4 - EMEA/HELVETIC AIRWAYS'
-        super(HelveticParser, self).__init__(
-            self.root + self.helvetic_path, file_pattern)
-
-    @staticmethod
-    def _get_event_description(s):
-        if len(s['Workorder Text'].strip()) > 0:
-            return s['Workorder Text']
-        else:
-            return re.findall(r'(?:(?:Technical)|(?:AOG))\s*Event\:\s*([\s\S]+?)\;', s['Description'], re.IGNORECASE)[0]
-
-    @staticmethod
-    def _get_event_action(s):
-        if len(s['Workorder Action'].strip()) > 0:
-            return s['Workorder Action']
-        else:
-            return re.findall(r'Solution\:\s*([\s\S]+?)\;', s['Description'], re.IGNORECASE)[0]
-
-    def get_cleaned_df(self, fname):
-
-        converters = {
-            'Occurrence Date': self._date_format_f, 'Ready Date': self._date_format_f}
-        df = self.load_file(fname, converters=converters)
-
-        cleaned_df = pd.DataFrame()
-        cleaned_df['Aircraft_Register__c'] = df['Description'].str.extract(
-            r'Aircraft\:\s*(.*?)\;', re.IGNORECASE, expand=False).str.strip()
-        cleaned_df['Start_Date__c'] = self._normalize_datetime(
-            df, 'Occurrence Date', 'Occurrence Time')
-        cleaned_df['Release_Date__c'] = self._normalize_datetime(
-            df, 'Ready Date', 'Ready Time')
-
-        df.fillna('', inplace=True)
-
-        cleaned_df['OOS_Total_Time__c'] = self._get_oos_from_dates(cleaned_df)
-        cleaned_df['Event_Record_Identifier__c'] = df['Description'].str.extract(
-            r'Status\:\s*(.*?)\;', re.IGNORECASE, expand=False).str.strip()
-
-        cleaned_df['Log_Number__c'] = df['Workorder Number'].astype(
-            int).apply(lambda x: np.nan if x <= 0 else x)
-
-        cleaned_df['Station__c'] = df['Repair Station'].str.strip()
-
-        cleaned_df['Operator_ATA_Chapter__c'] = df['ATA Chapter']
-
-        cleaned_df['Event_Description__c'] = df[['Workorder Text',
-                                                 'Description']].apply(self._get_event_description, axis=1).str.replace('\n', '<br>')
-        cleaned_df['Action_Description__c'] = df[['Workorder Action',
-                                                  'Description']].apply(self._get_event_action, axis=1).str.replace('\n', '<br>')
-
-        cleaned_df['Header__c'] = df['Header']
-        cleaned_df['Flight_Number__c'] = df['Event Flight Number'].astype(str)
-        cleaned_df['Reference_Date__c'] = self.get_reference_date(
-            fname, len(cleaned_df))
-
-        return cleaned_df
-
-
-class AstanaParser(Parser):
-
-    def __init__(self, root, file_pattern):
+    def __init__(self, root, file_pattern, spec, engine='pandas'):
         self.root = root
-        self.astana_path = '/4 - EMEA/AIR ASTANA'
-        super(AstanaParser, self).__init__(
-            self.root + self.astana_path, file_pattern)
+        self.spec = spec
+        super(OperatorParser, self).__init__(
+            self.root + spec['path'], file_pattern, engine)
+        self.name = spec['name']
+        self.version = '{}.{}'.format(Parser.version, spec.get('version', 1))
+        self.date_format = spec.get('date_format', Parser.date_format)
+        self.time_format = spec.get('time_format', Parser.time_format)
+        self.plan = [self._compile_field(field) for field in spec['fields']]
+        self.usecols = self._get_usecols()
+
+    def _get_usecols(self):
+        # sheets whose header has to be searched for are loaded whole
+        if 'header' in self.spec:
+            return None
+
+        usecols = []
+        extract = self.spec.get('extract')
+        if extract is not None:
+            usecols.append(extract['source'])
+        for field in self.spec['fields']:
+            usecols.extend(field.get('datetime', []))
+            for key in ('source', 'fallback'):
+                if key in field and not field[key].startswith('@'):
+                    usecols.append(field[key])
+        return list(dict.fromkeys(usecols))
 
     @staticmethod
-    def _normalize_oos_time(cell):
-        date = pd.to_datetime(cell)
-        return ((date.month - 1) * 31 * 24) + (date.day * 24) + date.hour + (date.minute / 60)
+    def _compile_transforms(names):
+        steps = []
+        for name in names:
+            args = []
+            if isinstance(name, list):
+                name, args = name[0], name[1:]
+            steps.append((transforms[name], args))
+
+        def apply(s):
+            for transform, args in steps:
+                s = transform(s, *args)
+            return s
+        return apply
+
+    def _compile_field(self, field):
+        # every field becomes one callable over (sheet, cleaned frame), with its
+        # transforms already chained so the plan runs a single step per column
+        apply = self._compile_transforms(field.get('transforms', []))
+
+        if 'datetime' in field:
+            return field['field'], lambda df, cleaned, fname: self._normalize_datetime(df, *field['datetime'])
+        if 'hours_between' in field:
+            return field['field'], lambda df, cleaned, fname: self._get_oos_from_dates(cleaned, *field['hours_between'])
+        if 'reference_date' in field:
+            return field['field'], lambda df, cleaned, fname: self.get_reference_date(fname, len(cleaned))
+        if 'category' in field or 'category_contains' in field:
+            return field['field'], self._category_step(field, apply)
+        if 'fallback' in field:
+            return field['field'], lambda df, cleaned, fname: apply(
+                _text_or_fallback(df[field['source']].fillna(''), df[field['fallback']]))
+        if field['source'].startswith('@'):
+            # fields extracted from a text stay NaN where they are missing
+            return field['field'], lambda df, cleaned, fname: apply(df[field['source']])
+        return field['field'], lambda df, cleaned, fname: apply(df[field['source']].fillna(''))
+
+    def __getstate__(self):
+        # the compiled plan holds closures, so worker processes rebuild it
+        state = self.__dict__.copy()
+        del state['plan']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.plan = [self._compile_field(field) for field in self.spec['fields']]
 
     @staticmethod
-    def _correlate_columns(df):
-        c_correlated = {}
+    def _category_column(df, field):
         for col in df.columns:
-            if col == 'Other':
-                c_correlated[col] = 'Others__c'
-            elif col == 'Parts Unavailability':
-                c_correlated[col] = 'Parts_Unavailability__c'
-            elif 'receive Embraer disposition' in col:
-                c_correlated[col] = 'Time_to_Receive_Embraer_Disposition__c'
-            elif 'Customer Operations' in col:
-                c_correlated[col] = 'Customer_Operation__c'
-            elif 'time for troubleshooting' in col:
-                c_correlated[col] = 'Time_to_Receive_Supplier_Disposition__c'
-
-        return c_correlated
-
-    def _prepare_df(self, df):
-        while df.columns[0] != 'A/C':
-            if df.iloc[0, 0] == 'A/C':
-                col_names = df.iloc[0]
-                df.columns = col_names
-            df = df.drop([0], axis=0).reset_index(drop=True)
-
-        category_series = df[['CATEGORY', 'CONTRIB (%)', 'COMMENTS']].groupby(
-            by=['CATEGORY']).apply(lambda x: x[['CONTRIB (%)', 'COMMENTS']].to_numpy())
-        df = df.replace(r'^\s*$', np.nan, regex=True)
-        df = df.dropna(axis='rows', subset=[
-            'A/C']).drop(columns=['CATEGORY', 'CONTRIB (%)', 'COMMENTS'])
-
-        t = np.concatenate(category_series.to_numpy()).reshape(
-            len(category_series), *category_series[0].shape)
-        comments = ['<br>'.join(t[:, i, 1][~pd.isnull(t[:, i, 1])])
-                    for i in range(t.shape[1])]
-
-        df[category_series.index] = category_series.to_numpy()
-        df['COMMENTS'] = comments
-
-        correlated_columns = self._correlate_columns(df)
-        for techrep_col in correlated_columns.keys():
-            df[techrep_col] = df[techrep_col].apply(
-                lambda x: x*100 if x <= 1 else x).fillna('').astype(str)
-
-        return df, correlated_columns
+            if 'category' in field and col == field['category']:
+                return col
+            if 'category_contains' in field and field['category_contains'] in str(col):
+                return col
+        return None
+
+    def _category_step(self, field, apply):
+        def step(df, cleaned, fname):
+            col = self._category_column(df, field)
+            return None if col is None else apply(df[col])
+        return step
+
+    def _prepare(self, df):
+        if 'header' in self.spec:
+            df = _find_header(df, self.spec['header'])
+        if 'category_rows' in self.spec:
+            rows = self.spec['category_rows']
+            df = _spread_category_rows(
+                df, self.spec['header'], rows['category'], rows['value'], rows['comment'])
+        extract = self.spec.get('extract')
+        if extract is not None:
+            pattern = re.compile(
+                extract['pattern'], re.IGNORECASE if extract.get('ignore_case') else 0)
+            groups = df[extract['source']].str.extract(pattern)
+            for group in groups.columns:
+                df['@' + group] = groups[group]
+        return df
 
     def get_cleaned_df(self, fname):
+        df = self._prepare(self.load_file(fname))
 
-        df = self.load_file(fname)
-        df, techrep_cols = self._prepare_df(df)
+        cleaned_df = pd.DataFrame(index=df.index)
+        for field, step in self.plan:
+            values = step(df, cleaned_df, fname)
+            if values is not None:
+                cleaned_df[field] = values
 
-        cleaned_df = pd.DataFrame()
-        cleaned_df['Aircraft_Register__c'] = df['A/C'].str.strip()
-        cleaned_df['Start_Date__c'] = self._normalize_datetime(
-            df, 'START DATE', 'START TIME(UTC)')
-        cleaned_df['Release_Date__c'] = self._normalize_datetime(
-            df, 'FINISH DATE', 'FINISH TIME(UTC)')
+        return cleaned_df.reset_index(drop=True)
 
-        df.fillna('', inplace=True)
-
-        cleaned_df['OOS_Total_Time__c'] = df['AOG time'].astype(
-            str).str.strip().apply(self._normalize_oos_time)
-
-        cleaned_df['Station__c'] = df['STATION'].str.strip()
-        cleaned_df['Event_Description__c'] = df['DEFECT'].str.replace(
-            '\n', '<br>')
-        cleaned_df['Action_Description__c'] = df['Rectification Action'].str.replace(
-            '\n', '<br>')
-
-        for col in df.columns:
-            if techrep_cols.get(col, None) is not None:
-                cleaned_df[techrep_cols[col]] = df[col]
-        cleaned_df['TechRep_Comments__c'] = df['COMMENTS']
 
-        return cleaned_df
+def load_operator_parsers(root, file_pattern, engine='pandas', spec_dir=operators_dir):
+    parsers = []
+    for fname in sorted(os.listdir(spec_dir)):
+        if fname.endswith('.json'):
+            with open(os.path.join(spec_dir, fname)) as f:
+                parsers.append(OperatorParser(
+                    root, file_pattern, json.load(f), engine))
+    return parsers
@@ -0,0 +1,110 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from history import history_db
+
+# sObject -> field holding the human readable key the sheets refer to;
+# root and fail codes aren't cached, as the sheet upload upserts the
+# former by Name and updates the latter by Id, so nothing looks them up
+reference_objects = {
+    'Aircraft__c': 'Registration__c',
+    'Supplier__c': 'Name',
+}
+# deleted records stay visible to queryAll only while in the recycle bin,
+# so a cache last synced longer ago than that is loaded again from scratch
+full_refresh_after = timedelta(days=14)
+
+
+class ReferenceCache:
+
+    def __init__(self, sf_api, path=history_db, objects=reference_objects):
+        self.sf_api = sf_api
+        self.objects = objects
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS reference_ids (
+                object TEXT,
+                name TEXT,
+                id TEXT,
+                PRIMARY KEY (object, name)
+            );
+            CREATE INDEX IF NOT EXISTS reference_ids_id ON reference_ids (object, id);
+            CREATE TABLE IF NOT EXISTS reference_sync (
+                object TEXT PRIMARY KEY,
+                last_sync TEXT,
+                synced_at TEXT
+            );
+        ''')
+        # caches from before synced_at was kept get reloaded once
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(reference_sync)')]
+        if 'synced_at' not in columns:
+            with self.conn:
+                self.conn.execute('ALTER TABLE reference_sync ADD COLUMN synced_at TEXT')
+        self.frames = {}
+
+    def last_sync(self, obj_api):
+        # the newest SystemModstamp seen, or None when the cache has to be
+        # loaded whole because it was last synced too long ago
+        row = self.conn.execute(
+            'SELECT last_sync, synced_at FROM reference_sync WHERE object = ?', (obj_api,)).fetchone()
+        if row is None or row[1] is None or datetime.now() - datetime.fromisoformat(row[1]) > full_refresh_after:
+            return None
+        return row[0]
+
+    def refresh(self, obj_api):
+        key = self.objects[obj_api]
+        soql = 'SELECT Id, {}, IsDeleted, SystemModstamp FROM {}'.format(key, obj_api)
+        last_sync = self.last_sync(obj_api)
+        full = last_sync is None
+        if not full:
+            soql += ' WHERE SystemModstamp > ' + last_sync
+
+        df = self.sf_api.query(soql, include_deleted=True)
+        self.frames.pop(obj_api, None)
+        if df is None:
+            df = pd.DataFrame(columns=['Id', key, 'IsDeleted', 'SystemModstamp'])
+
+        # the stamp comes from the server clock, so local clock skew can't
+        # make the next refresh skip records; it is truncated to seconds,
+        # which at worst fetches the last changed record once more
+        stamp = pd.to_datetime(df['SystemModstamp'], utc=True).max()
+        # deleted records and records whose name was cleared or changed
+        # must not stay reachable under their old name
+        current = df[df[key].notna() & (df['IsDeleted'] != True)]
+        with self.conn:
+            if full:
+                self.conn.execute('DELETE FROM reference_ids WHERE object = ?', (obj_api,))
+            else:
+                self.conn.executemany(
+                    'DELETE FROM reference_ids WHERE object = ? AND id = ?',
+                    [(obj_api, record_id) for record_id in df['Id']])
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO reference_ids VALUES (?, ?, ?)',
+                [(obj_api, str(name), record_id) for name, record_id in zip(current[key], current['Id'])])
+            self.conn.execute(
+                'INSERT OR REPLACE INTO reference_sync VALUES (?, ?, ?)',
+                (obj_api, last_sync if pd.isnull(stamp) else stamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                 datetime.now().isoformat()))
+        return len(df)
+
+    def ids(self, obj_api):
+        df = self.frames.get(obj_api)
+        if df is None:
+            df = self.frames[obj_api] = pd.read_sql_query(
+                'SELECT name, id FROM reference_ids WHERE object = ?', self.conn, params=(obj_api,))
+        return df
+
+    def resolve(self, df, column, obj_api, target):
+        # a left merge keeps every input row; rows without a match come
+        # back with a null target and are listed as unknown
+        ids = self.ids(obj_api).rename(columns={'name': column, 'id': target})
+        keys = df[column].where(df[column].isna(), df[column].astype(str))
+        resolved = pd.merge(keys.to_frame(), ids, how='left', on=column)
+        df = df.assign(**{target: resolved[target].to_numpy()})
+        unknown = df[df[target].isna()]
+        return df, unknown
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,53 @@
+import json
+
+# Bulk API 2.0 accepts up to 150MB per upload once base64 encoded, which
+# leaves 100MB of raw CSV (and well under 150M characters) per job
+max_upload_bytes = 100 * 1024 * 1024
+chunk_rows = 10000
+
+
+def blank_mask(df):
+    # None, NaN and '' all mean "leave the field out"
+    return df.isna() | (df == '')
+
+
+def iter_csv_uploads(df, max_bytes=max_upload_bytes, piece_rows=chunk_rows):
+    header = df.iloc[:0].to_csv(index=False, line_terminator='\n')
+    pieces = [header]
+    size = len(header.encode('utf-8'))
+    n_rows = 0
+
+    for start in range(0, len(df), piece_rows):
+        chunk = df.iloc[start:start + piece_rows]
+        # blank cells are left empty, which Bulk 2.0 reads as "not set"; a
+        # bare carriage return would go out unquoted and break the record,
+        # so it is sent as the line feed it stands for
+        piece = chunk.mask(blank_mask(chunk)).replace(r'\r(?!\n)', '\n', regex=True).to_csv(
+            index=False, header=False, line_terminator='\n')
+        piece_size = len(piece.encode('utf-8'))
+        if n_rows > 0 and size + piece_size > max_bytes:
+            yield ''.join(pieces), n_rows
+            pieces = [header]
+            size = len(header.encode('utf-8'))
+            n_rows = 0
+        pieces.append(piece)
+        size += piece_size
+        n_rows += len(chunk)
+
+    if n_rows > 0:
+        yield ''.join(pieces), n_rows
+
+
+def iter_record_chunks(df, piece_rows=chunk_rows):
+    columns = list(df.columns)
+    for start in range(0, len(df), piece_rows):
+        chunk = df.iloc[start:start + piece_rows]
+        keep = ~blank_mask(chunk).to_numpy()
+        values = chunk.to_numpy(dtype=object)
+        yield [{col: value for col, value, kept in zip(columns, row, keep_row) if kept}
+               for row, keep_row in zip(values, keep)]
+
+
+def iter_json_lines(df, piece_rows=chunk_rows):
+    for records in iter_record_chunks(df, piece_rows):
+        yield ''.join(json.dumps(record, default=str) + '\n' for record in records)
@@ -0,0 +1,84 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from simple_salesforce import Salesforce, SalesforceExpiredSession
+from simple_salesforce.login import SalesforceLogin
+
+from limits import limits
+
+# enough pooled keep-alive connections for the query and bulk thread pools
+pool_connections = 4
+pool_maxsize = 16
+
+
+def new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # every response reports the org's API usage in its headers
+    session.hooks['response'].append(limits.observe)
+    return session
+
+
+class ManagedSalesforce(Salesforce):
+
+    def __init__(self, username, password, security_token, domain, session):
+        self._credentials = (username, password, security_token, domain)
+        self._login_lock = threading.Lock()
+        super().__init__(username=username, password=password, security_token=security_token,
+                         domain=domain, session=session)
+
+    def relogin(self, expired_session_id):
+        with self._login_lock:
+            # another thread may already have replaced the expired session
+            if self.session_id != expired_session_id:
+                return
+            username, password, security_token, domain = self._credentials
+            self.session_id, self.sf_instance = SalesforceLogin(
+                session=self.session, username=username, password=password,
+                security_token=security_token, sf_version=self.sf_version, domain=domain)
+            self.headers = {
+                'Content-Type': 'application/json',
+                'Authorization': 'Bearer ' + self.session_id,
+                'X-PrettyPrint': '1'
+            }
+            self.base_url = 'https://{}/services/data/v{}/'.format(self.sf_instance, self.sf_version)
+            self.apex_url = 'https://{}/services/apexrest/'.format(self.sf_instance)
+            self.bulk_url = 'https://{}/services/async/{}/'.format(self.sf_instance, self.sf_version)
+
+    def _call_salesforce(self, method, url, name='', **kwargs):
+        session_id = self.session_id
+        try:
+            return super()._call_salesforce(method, url, name, **kwargs)
+        except SalesforceExpiredSession:
+            self.relogin(session_id)
+            # urls built from the old instance still point at the right org
+            return super()._call_salesforce(method, url, name, **kwargs)
+
+
+class SessionManager:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.http_session = new_http_session()
+        self.clients = {}
+
+    def get(self, username, password, security_token, domain):
+        # one logged in client per set of credentials, so changing them in
+        # the login screen simply logs in again
+        key = (username, password, security_token, domain)
+        with self.lock:
+            sf = self.clients.get(key)
+            if sf is None:
+                sf = self.clients[key] = ManagedSalesforce(
+                    username, password, security_token, domain, self.http_session)
+            return sf
+
+    def forget(self):
+        with self.lock:
+            self.clients = {}
+
+
+sessions = SessionManager()
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from history import history_db
+
+# sObject -> fields kept locally for the export sheet, besides Id
+export_objects = {
+    'Out_of_service__c': [
+        'Aircraft_Register__c', 'Project__c', 'Operator__c', 'Station__c', 'Flight_Number__c',
+        'Event_Record_Identifier__c', 'Inter_ID__c', 'Log_Number__c', 'Reference_Date__c', 'Header__c',
+        'Event_Description__c', 'Action_Description__c', 'Start_Date__c', 'Release_Date__c',
+        'OOS_Total_Time__c', 'Chargeable__c', 'Exclusion_Code__c', 'Dispatched_On_MEL__c',
+        'Remove_Availability_Market__c', 'Parts_Unavailability__c', 'Customer_Operation__c',
+        'Time_to_Receive_Supplier_Disposition__c', 'Time_to_Receive_Embraer_Disposition__c',
+        'Expected_Time_For_Troubleshooting__c', 'Others__c', 'TechRep_Comments__c',
+        'Solution_Description__c', 'Solution_Release_Date__c', 'Issue_Status__c',
+        'Before_Event_Date__c', 'PCR__c', 'EPR__c', 'JIRA__c', 'eFleet__c', 'CMC_Message__c',
+        'EFTC_Comments__c', 'Component_Serial_Number__c', 'Component_Part_Number__c'],
+    'FC_OOS_Association__c': ['Fail_Code__c', 'Out_of_service__c'],
+    'RC_OOS_Association__c': ['Root_Code__c', 'Out_of_service__c'],
+    'Fail_Codes__c': ['Name', 'ATA__c', 'Technology__c'],
+    'Root_Codes__c': ['Name', 'ATA__c', 'Supplier__c'],
+    'Supplier__c': ['Name'],
+}
+
+# deleted records only show up in queryAll while they sit in the recycle
+# bin, so an older snapshot can't be trusted to know about every deletion
+max_delta_age = timedelta(days=14)
+
+numeric_text = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+class RecordSnapshot:
+
+    def __init__(self, sf_api, path=history_db, objects=export_objects):
+        self.sf_api = sf_api
+        self.objects = objects
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                object TEXT,
+                id TEXT,
+                data TEXT,
+                PRIMARY KEY (object, id)
+            );
+            CREATE TABLE IF NOT EXISTS record_sync (
+                object TEXT PRIMARY KEY,
+                last_sync TEXT,
+                synced_at TEXT
+            );
+        ''')
+
+    def _last_sync(self, obj_api):
+        row = self.conn.execute(
+            'SELECT last_sync, synced_at FROM record_sync WHERE object = ?', (obj_api,)).fetchone()
+        if row is None or datetime.now() - datetime.fromisoformat(row[1]) > max_delta_age:
+            return None
+        return row[0]
+
+    def sync(self, obj_api):
+        fields = self.objects[obj_api]
+        soql = 'SELECT Id, {}, SystemModstamp, IsDeleted FROM {}'.format(
+            ', '.join(fields), obj_api)
+        last_sync = self._last_sync(obj_api)
+        if last_sync is not None:
+            soql += ' WHERE SystemModstamp > ' + last_sync
+
+        stamp = None
+        n_changed = 0
+        with self.conn:
+            if last_sync is None:
+                self.conn.execute('DELETE FROM records WHERE object = ?', (obj_api,))
+
+            for df in self.sf_api.iter_query(soql, include_deleted=True):
+                page_stamp = pd.to_datetime(df['SystemModstamp'], utc=True).max()
+                stamp = page_stamp if stamp is None else max(stamp, page_stamp)
+                n_changed += len(df)
+
+                deleted = df['IsDeleted'] == True
+                self.conn.executemany(
+                    'DELETE FROM records WHERE object = ? AND id = ?',
+                    [(obj_api, record_id) for record_id in df.loc[deleted, 'Id']])
+
+                live = df.loc[~deleted].reindex(columns=fields)
+                live = live.astype(object).where(live.notna(), None)
+                self.conn.executemany(
+                    'INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                    [(obj_api, record_id, json.dumps(dict(zip(fields, row))))
+                     for record_id, row in zip(df.loc[~deleted, 'Id'], live.itertuples(index=False))])
+
+            if stamp is None:
+                stamp_text = last_sync
+            else:
+                stamp_text = stamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+            self.conn.execute('INSERT OR REPLACE INTO record_sync VALUES (?, ?, ?)',
+                              (obj_api, stamp_text, datetime.now().isoformat()))
+        return n_changed
+
+    def sync_all(self):
+        return {obj_api: self.sync(obj_api) for obj_api in self.objects}
+
+    def frame(self, obj_api):
+        fields = self.objects[obj_api]
+        rows = self.conn.execute(
+            'SELECT id, data FROM records WHERE object = ?', (obj_api,)).fetchall()
+        columns = {'Id': [record_id for record_id, _ in rows]}
+        data = [json.loads(text) for _, text in rows]
+        for field in fields:
+            columns[field] = [record[field] for record in data]
+        return pd.DataFrame(columns, columns=['Id'] + fields)
+
+    def export_frames(self):
+        # rebuilds the same three frames the full export queries return,
+        # joining the association objects to their codes locally
+        df = self.frame('Out_of_service__c')
+
+        fail_codes = self.frame('Fail_Codes__c').rename(columns={
+            'Id': 'Fail_Code__r.Id', 'Name': 'Fail_Code__r.Name', 'ATA__c': 'Fail_Code__r.ATA__c',
+            'Technology__c': 'Fail_Code__r.Technology__c'})
+        df_fc = pd.merge(self.frame('FC_OOS_Association__c'), fail_codes, how='left',
+                         left_on='Fail_Code__c', right_on='Fail_Code__r.Id')
+        df_fc = df_fc.rename(columns={'Out_of_service__c': 'Out_of_service__r.Id'})[[
+            'Fail_Code__r.Id', 'Fail_Code__r.Name', 'Fail_Code__r.ATA__c',
+            'Fail_Code__r.Technology__c', 'Out_of_service__r.Id']]
+
+        suppliers = self.frame('Supplier__c').rename(columns={
+            'Id': 'Supplier__c', 'Name': 'Root_Code__r.Supplier__r.Name'})
+        root_codes = pd.merge(self.frame('Root_Codes__c'), suppliers, how='left', on='Supplier__c')
+        root_codes = root_codes.rename(columns={
+            'Id': 'Root_Code__c', 'Name': 'Root_Code__r.Name', 'ATA__c': 'Root_Code__r.ATA__c'})
+        df_rc = pd.merge(self.frame('RC_OOS_Association__c'), root_codes, how='left', on='Root_Code__c')
+        df_rc = df_rc.rename(columns={'Out_of_service__c': 'Out_of_service__r.Id'})[[
+            'Root_Code__r.Name', 'Root_Code__r.ATA__c', 'Root_Code__r.Supplier__r.Name',
+            'Out_of_service__r.Id']]
+
+        return df, df_fc, df_rc
+
+    def close(self):
+        self.conn.close()
+
+
+def canonical_value(value):
+    # what an exported cell reads back as once it went through a workbook:
+    # blanks are empty, and numbers - or text read_excel takes for numbers,
+    # like an ATA chapter '05' - lose leading zeros and whole decimals
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    if isinstance(value, str) and numeric_text.match(value):
+        value = float(value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def canonical_frame(df):
+    return df.astype(object).applymap(canonical_value)
+
+
+class ExportBaseline:
+
+    def __init__(self, path=history_db):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS export_baseline (
+                export TEXT,
+                id TEXT,
+                row_hash TEXT,
+                data TEXT,
+                PRIMARY KEY (export, id)
+            )
+        ''')
+
+    @staticmethod
+    def _row_hash(values):
+        return hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+    def record(self, export, chunk):
+        chunk = canonical_frame(chunk)
+        columns = list(chunk.columns)
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO export_baseline VALUES (?, ?, ?, ?)',
+                [(export, row[columns.index('Id')], self._row_hash(row), json.dumps(dict(zip(columns, row))))
+                 for row in chunk.itertuples(index=False, name=None)])
+
+    def track(self, export, chunks):
+        # records every chunk on its way to the export writer
+        self.conn.execute('DELETE FROM export_baseline WHERE export = ?', (export,))
+        for chunk in chunks:
+            self.record(export, chunk)
+            yield chunk
+
+    def changed_cells(self, export, df):
+        # True where a cell differs from what was exported; rows the export
+        # never had count as changed throughout
+        baseline = {record_id: (row_hash, data) for record_id, row_hash, data in self.conn.execute(
+            'SELECT id, row_hash, data FROM export_baseline WHERE export = ?', (export,))}
+        current = canonical_frame(df)
+        columns = list(current.columns)
+        changed = np.ones(current.shape, dtype=bool)
+        for pos, row in enumerate(current.itertuples(index=False, name=None)):
+            entry = baseline.get(row[columns.index('Id')])
+            if entry is None:
+                continue
+            if self._row_hash(row) == entry[0]:
+                changed[pos] = False
+            else:
+                data = json.loads(entry[1])
+                changed[pos] = [data.get(col) != value for col, value in zip(columns, row)]
+        return pd.DataFrame(changed, index=df.index, columns=columns)
+
+    def has_export(self, export):
+        return self.conn.execute(
+            'SELECT 1 FROM export_baseline WHERE export = ? LIMIT 1', (export,)).fetchone() is not None
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageError(Exception):
+    pass
+
+
+def _timed(fn, done):
+    start = time.perf_counter()
+    result = fn(done)
+    return result, time.perf_counter() - start
+
+
+def run_stages(stages, max_workers=4):
+    # stages maps a name to (fn, dependencies); every fn is called with the
+    # results of the stages finished so far and starts as soon as all of
+    # its dependencies are done
+    for name, (_, deps) in stages.items():
+        for dep in deps:
+            if dep not in stages:
+                raise StageError('stage {} depends on unknown stage {}'.format(name, dep))
+
+    done = {}
+    timings = {}
+    failed = {}
+    pending = dict(stages)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            for name, (fn, deps) in list(pending.items()):
+                if any(dep in failed for dep in deps):
+                    failed[name] = StageError('skipped, {} failed'.format(
+                        ', '.join(dep for dep in deps if dep in failed)))
+                    del pending[name]
+                elif all(dep in done for dep in deps):
+                    running[executor.submit(_timed, fn, dict(done))] = name
+                    del pending[name]
+
+            if len(running) == 0:
+                if len(pending) > 0:
+                    raise StageError('stages with cyclic dependencies: ' + ', '.join(pending))
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    done[name], timings[name] = future.result()
+                except Exception as e:
+                    failed[name] = e
+
+    return done, timings, failed
+
+
+def print_timings(timings, failed):
+    print('--- STAGES ---')
+    for name, seconds in timings.items():
+        print('{}: {:.1f}s'.format(name, seconds))
+    for name, error in failed.items():
+        print('{}: FAILED ({})'.format(name, error))
+    print('--------------')
@@ -0,0 +1,165 @@
+import threading
+
+import pandas as pd
+
+import api
+import sessions
+from api import SFApi
+
+
+def _record(record_id, aircraft=None):
+    record = {'attributes': {'type': 'Out_of_service__c'}, 'Id': record_id, 'Header__c': 'h' + record_id}
+    record['Serial_Number__r'] = aircraft and {
+        'attributes': {'type': 'Aircraft__c'}, 'Registration__c': aircraft}
+    return record
+
+
+def _pages(fake_salesforce, pages, gate=None):
+    # one query resource plus a nextRecordsUrl per following page
+    def page(idx):
+        body = {'totalSize': sum(len(p) for p in pages), 'done': idx == len(pages) - 1,
+                'records': pages[idx]}
+        if idx < len(pages) - 1:
+            body['nextRecordsUrl'] = '/services/data/v42.0/query/01g-{}'.format(idx + 1)
+        return body
+
+    def more(idx):
+        def handler(request):
+            if gate is not None:
+                gate.wait(5)
+            return 200, 'application/json', page(idx)
+        return handler
+
+    fake_salesforce.route('GET', 'query/', lambda request: (200, 'application/json', page(0)))
+    for idx in range(1, len(pages)):
+        fake_salesforce.route('GET', 'query/01g-{}'.format(idx), more(idx))
+
+
+def test_iter_query_yields_one_frame_per_page(fake_salesforce, sf_api):
+    _pages(fake_salesforce, [[_record('1', 'PR-AAA'), _record('2')], [_record('3', 'PR-BBB')], [_record('4')]])
+
+    chunks = list(sf_api.iter_query('SELECT Id FROM Out_of_service__c'))
+
+    assert [list(chunk['Id']) for chunk in chunks] == [['1', '2'], ['3'], ['4']]
+    assert list(chunks[0].columns) == ['Id', 'Header__c', 'Serial_Number__r.Registration__c']
+    assert chunks[0]['Serial_Number__r.Registration__c'].tolist() == ['PR-AAA', None]
+    assert 'Serial_Number__r.Registration__c' not in chunks[2].columns
+    assert fake_salesforce.paths('GET') == ['/services/data/v42.0/query/',
+                                            '/services/data/v42.0/query/01g-1',
+                                            '/services/data/v42.0/query/01g-2']
+    assert fake_salesforce.requests[0]['query']['q'] == ['SELECT Id FROM Out_of_service__c']
+
+
+def test_iter_query_prefetches_next_page(fake_salesforce, sf_api):
+    gate = threading.Event()
+    _pages(fake_salesforce, [[_record('1')], [_record('2')]], gate)
+
+    chunks = sf_api.iter_query('SELECT Id FROM Out_of_service__c')
+    first = next(chunks)
+    # the next page was requested before the consumer asked for it
+    for _ in range(100):
+        if len(fake_salesforce.requests) == 2:
+            break
+        threading.Event().wait(0.05)
+    assert fake_salesforce.paths() == ['/services/data/v42.0/query/', '/services/data/v42.0/query/01g-1']
+    gate.set()
+
+    assert first['Id'].tolist() == ['1']
+    assert [chunk['Id'].tolist() for chunk in chunks] == [['2']]
+
+
+def test_iteractive_query_stops_after_first_page(fake_salesforce, sf_api):
+    _pages(fake_salesforce, [[_record('1')], [_record('2')]])
+
+    df = sf_api.query('SELECT Id FROM Out_of_service__c', iteractive=True)
+
+    assert df['Id'].tolist() == ['1']
+    assert fake_salesforce.paths() == ['/services/data/v42.0/query/']
+
+
+def test_query_concatenates_pages_and_handles_empty(fake_salesforce, sf_api):
+    _pages(fake_salesforce, [[_record('1', 'PR-AAA')], [_record('2')]])
+    df = sf_api.query('SELECT Id FROM Out_of_service__c')
+    assert df['Id'].tolist() == ['1', '2']
+    assert pd.isna(df.loc[1, 'Serial_Number__r.Registration__c'])
+
+    fake_salesforce.route('GET', 'query/', lambda request: (
+        200, 'application/json', {'totalSize': 0, 'done': True, 'records': []}))
+    assert sf_api.query('SELECT Id FROM Out_of_service__c') is None
+
+
+def test_include_deleted_uses_query_all(fake_salesforce, sf_api):
+    fake_salesforce.route('GET', 'queryAll/', lambda request: (
+        200, 'application/json', {'totalSize': 1, 'done': True, 'records': [_record('1')]}))
+
+    df = sf_api.query('SELECT Id FROM Out_of_service__c', include_deleted=True)
+
+    assert df['Id'].tolist() == ['1']
+    assert fake_salesforce.paths() == ['/services/data/v42.0/queryAll/']
+
+
+def test_fresh_connect_logs_in_again(monkeypatch):
+    logins = []
+    revoked = []
+
+    class FakeClient:
+        def __init__(self, username, password, security_token, domain, session):
+            logins.append(username)
+            if username in revoked:
+                raise ValueError('INVALID_LOGIN')
+
+    preferences = {'entry_username': 'user', 'entry_password': 'secret',
+                   'entry_token_security': 'token', 'variable_radio': 'prod'}
+    monkeypatch.setattr(api, 'read_preferences', lambda: dict(preferences))
+    monkeypatch.setattr(sessions, 'ManagedSalesforce', FakeClient)
+    monkeypatch.setattr(sessions, 'sessions', sessions.SessionManager())
+    monkeypatch.setattr(api, 'sessions', sessions.sessions)
+
+    assert SFApi().connect() == ['LOGIN:SUCCESS']
+    assert SFApi().connect() == ['LOGIN:SUCCESS']
+    assert logins == ['user']
+    assert SFApi().connect(fresh=True) == ['LOGIN:SUCCESS']
+    assert logins == ['user', 'user']
+
+    # credentials revoked after the first login only show up on a fresh one
+    revoked.append('user')
+    assert SFApi().connect() == ['LOGIN:SUCCESS']
+    assert SFApi().connect(fresh=True) == ['LOGIN:FAILED', 'PROBLEM:MAYBE YOUR CREDENTIALS ARE INCORRECT!']
+
+
+def test_soql_quote_escapes_quotes_and_backslashes():
+    assert SFApi._soql_quote('PR-AAA') == "'PR-AAA'"
+    assert SFApi._soql_quote("O'Brien") == "'O\\'Brien'"
+    assert SFApi._soql_quote('a\\b') == "'a\\\\b'"
+    assert SFApi._soql_quote(5) == "'5'"
+
+
+def test_in_clauses_split_by_count_and_length(monkeypatch):
+    assert list(SFApi._chunk_in_clauses('Name', ['a'], 200)) == ["Name IN ('a')"]
+    assert list(SFApi._chunk_in_clauses('Name', ['a', 'b', 'c'], 2)) == ["Name IN ('a', 'b')", "Name IN ('c')"]
+
+    # each quoted value takes its length plus the separator
+    monkeypatch.setattr(api, 'max_in_clause_length', 14)
+    assert list(SFApi._chunk_in_clauses('Name', ['aaa', 'bbb', 'ccc'], 200)) == [
+        "Name IN ('aaa', 'bbb')", "Name IN ('ccc')"]
+    # a value longer than the limit still goes out, alone
+    assert list(SFApi._chunk_in_clauses('Name', ['a' * 20, 'b'], 200)) == [
+        "Name IN ('{}')".format('a' * 20), "Name IN ('b')"]
+
+
+def test_query_in_runs_one_query_per_clause(fake_salesforce, sf_api):
+    def query(request):
+        soql = request['query']['q'][0]
+        names = [name.strip(" '") for name in soql[soql.index('(') + 1:-1].split(',')]
+        return 200, 'application/json', {'totalSize': len(names), 'done': True,
+                                         'records': [_record(name) for name in names]}
+
+    fake_salesforce.route('GET', 'query/', query)
+
+    df = sf_api.query_in('SELECT Id FROM Out_of_service__c WHERE {}', 'Id',
+                         ['1', '2', None, '2', '3'], chunk_size=2)
+
+    assert sorted(df['Id']) == ['1', '2', '3']
+    assert sorted(r['query']['q'][0] for r in fake_salesforce.requests) == [
+        "SELECT Id FROM Out_of_service__c WHERE Id IN ('1', '2')",
+        "SELECT Id FROM Out_of_service__c WHERE Id IN ('3')"]
@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from simple_salesforce import SalesforceExpiredSession, SalesforceMalformedRequest
+
+from async_api import AsyncSFApi
+
+
+class FakeClient:
+
+    def __init__(self, instance):
+        self.session_id = 'OLD'
+        self.base_url = 'http://{}/services/data/v42.0/'.format(instance)
+        self.relogins = 0
+
+    def relogin(self, expired_session_id):
+        self.relogins += 1
+        self.session_id = 'NEW'
+
+
+def _run(sf, coroutine):
+    async def main():
+        async with AsyncSFApi(SimpleNamespace(sf=sf), rate=1000) as async_api:
+            return await coroutine(async_api)
+    return asyncio.run(main())
+
+
+def _page(records, next_idx=None):
+    body = {'totalSize': len(records), 'done': next_idx is None, 'records': records}
+    if next_idx is not None:
+        body['nextRecordsUrl'] = '/services/data/v42.0/query/01g-{}'.format(next_idx)
+    return 200, 'application/json', body
+
+
+def test_query_pages_and_pages_in_truncated_children(fake_salesforce):
+    children = {'totalSize': 3, 'done': False, 'nextRecordsUrl': '/services/data/v42.0/query/01g-c',
+                'records': [{'attributes': {}, 'Name': 'FC-1'}]}
+    fake_salesforce.route('GET', 'query/', lambda request: _page(
+        [{'attributes': {}, 'Id': 'a1', 'FC__r': children}], 1))
+    fake_salesforce.route('GET', 'query/01g-1', lambda request: _page([{'attributes': {}, 'Id': 'a2', 'FC__r': None}]))
+    fake_salesforce.route('GET', 'query/01g-c', lambda request: (200, 'application/json', {
+        'done': True, 'records': [{'attributes': {}, 'Name': 'FC-2'}, {'attributes': {}, 'Name': 'FC-3'}]}))
+
+    df = _run(FakeClient(fake_salesforce.instance),
+              lambda async_api: async_api.query('SELECT Id FROM Out_of_service__c', children='rows'))
+
+    assert df['Id'].tolist() == ['a1', 'a1', 'a1', 'a2']
+    assert df['FC__r.Name'].tolist()[:3] == ['FC-1', 'FC-2', 'FC-3']
+
+
+def test_stopping_early_cancels_the_prefetch(fake_salesforce):
+    fake_salesforce.route('GET', 'query/', lambda request: _page([{'attributes': {}, 'Id': 'a1'}], 1))
+    fake_salesforce.route('GET', 'query/01g-1', lambda request: _page([{'attributes': {}, 'Id': 'a2'}]))
+
+    async def first_page(async_api):
+        pages = async_api.iter_query('SELECT Id FROM Out_of_service__c')
+        async for df in pages:
+            break
+        await pages.aclose()
+        await asyncio.sleep(0)
+        # nothing is left running once the generator is closed
+        return df, [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    df, pending = _run(FakeClient(fake_salesforce.instance), first_page)
+
+    assert df['Id'].tolist() == ['a1']
+    assert pending == []
+
+
+def test_error_responses_raise_salesforce_errors(fake_salesforce):
+    fake_salesforce.route('GET', 'query/', lambda request: (
+        400, 'application/json', [{'errorCode': 'MALFORMED_QUERY', 'message': 'unexpected token'}]))
+
+    with pytest.raises(SalesforceMalformedRequest) as error:
+        _run(FakeClient(fake_salesforce.instance), lambda async_api: async_api.query('SELECT'))
+    assert error.value.content[0]['errorCode'] == 'MALFORMED_QUERY'
+
+
+def test_expired_session_logs_in_again_once(fake_salesforce):
+    def query(request):
+        if request['headers']['Authorization'] != 'Bearer NEW':
+            return 401, 'application/json', [{'errorCode': 'INVALID_SESSION_ID', 'message': 'expired'}]
+        return _page([{'attributes': {}, 'Id': 'a1'}])
+
+    fake_salesforce.route('GET', 'query/', query)
+    sf = FakeClient(fake_salesforce.instance)
+    df = _run(sf, lambda async_api: async_api.query('SELECT Id FROM Out_of_service__c'))
+    assert df['Id'].tolist() == ['a1']
+    assert sf.relogins == 1
+
+    # a session refused right after logging in again is an error, not a loop
+    fake_salesforce.route('GET', 'query/', lambda request: (401, 'text/plain', 'Session expired'))
+    with pytest.raises(SalesforceExpiredSession) as error:
+        _run(sf, lambda async_api: async_api.query('SELECT Id FROM Out_of_service__c'))
+    assert error.value.content == 'Session expired'
+    assert sf.relogins == 2
@@ -0,0 +1,97 @@
+import csv
+import io
+
+import pandas as pd
+import pytest
+
+from bulk import Bulk2Api
+
+
+def _job(fake_salesforce, results):
+    # one ingest job whose result files are built from the uploaded CSV by
+    # results(rows), which returns {kind: [(row, sf_fields)]}
+    uploaded = {}
+
+    def batches(request):
+        uploaded['data'] = request['body'].decode('utf-8')
+        return 201, 'text/plain', ''
+
+    def result_file(kind):
+        def handler(request):
+            rows = list(csv.DictReader(io.StringIO(uploaded['data'], newline='')))
+            out = io.StringIO(newline='')
+            writer = None
+            for row, sf_fields in results(rows).get(kind, []):
+                record = dict(sf_fields, **row)
+                if writer is None:
+                    writer = csv.DictWriter(out, list(record), lineterminator='\n')
+                    writer.writeheader()
+                writer.writerow(record)
+            return 200, 'text/csv', out.getvalue()
+        return handler
+
+    fake_salesforce.route('POST', 'jobs/ingest/', lambda request: (200, 'application/json', {'id': '750J'}))
+    fake_salesforce.route('PUT', 'jobs/ingest/750J/batches', batches)
+    fake_salesforce.route('PATCH', 'jobs/ingest/750J', lambda request: (200, 'application/json', {}))
+    fake_salesforce.route('GET', 'jobs/ingest/750J', lambda request: (
+        200, 'application/json', {'id': '750J', 'state': 'JobComplete'}))
+    for kind in ['successfulResults', 'failedResults', 'unprocessedrecords']:
+        fake_salesforce.route('GET', 'jobs/ingest/750J/{}/'.format(kind), result_file(kind))
+    return uploaded
+
+
+def test_results_keep_upload_order_with_line_breaks_in_values(fake_salesforce, sf):
+    df = pd.DataFrame({'Header__c': ['h1', 'h2', 'h3'],
+                       'Description__c': ['first\r\nsecond', 'old\rmac', 'plain']})
+
+    def results(rows):
+        # the result files come back in a different order than uploaded
+        return {'successfulResults': [(rows[2], {'sf__Id': 'a3', 'sf__Created': 'true'}),
+                                      (rows[0], {'sf__Id': 'a1', 'sf__Created': 'true'})],
+                'failedResults': [(rows[1], {'sf__Id': '', 'sf__Error': 'REQUIRED_FIELD_MISSING'})]}
+
+    uploaded = _job(fake_salesforce, results)
+    out = Bulk2Api(sf).run('Out_of_service__c', 'insert', df)
+
+    assert '"first\r\nsecond"' in uploaded['data']
+    assert '"old\nmac"' in uploaded['data']
+    assert len(out) == 3
+    assert [r['id'] for r in out] == ['a1', None, 'a3']
+    assert [r['success'] for r in out] == [True, False, True]
+    assert out[1]['errors'] == ['REQUIRED_FIELD_MISSING']
+
+
+def test_update_rows_fall_back_to_the_record_id(fake_salesforce, sf):
+    df = pd.DataFrame({'Id': ['a1', 'a2'], 'Status__c': ['Open', 'Closed']})
+
+    def results(rows):
+        # Salesforce echoes a value in another form than it was sent
+        changed = dict(rows[1], Status__c='closed')
+        return {'successfulResults': [(changed, {'sf__Id': 'a2', 'sf__Created': 'false'}),
+                                      (rows[0], {'sf__Id': 'a1', 'sf__Created': 'false'})]}
+
+    _job(fake_salesforce, results)
+    out = Bulk2Api(sf).run('Out_of_service__c', 'update', df)
+
+    assert [r['id'] for r in out] == ['a1', 'a2']
+    assert all(r['success'] for r in out)
+
+
+def test_rows_left_without_results_carry_the_job_state(fake_salesforce, sf):
+    df = pd.DataFrame({'Header__c': ['h1', 'h2']})
+    _job(fake_salesforce, lambda rows: {'successfulResults': [(rows[0], {'sf__Id': 'a1', 'sf__Created': 'true'})]})
+
+    out = Bulk2Api(sf).run('Out_of_service__c', 'insert', df)
+
+    assert len(out) == 2
+    assert out[1] == {'success': False, 'created': False, 'id': None, 'errors': ['JobComplete']}
+
+
+def test_result_matching_no_uploaded_row_raises(fake_salesforce, sf):
+    df = pd.DataFrame({'Header__c': ['h1']})
+    _job(fake_salesforce, lambda rows: {'successfulResults': [
+        (rows[0], {'sf__Id': 'a1', 'sf__Created': 'true'}),
+        ({'Header__c': 'other'}, {'sf__Id': 'a2', 'sf__Created': 'true'})]})
+
+    with pytest.raises(ValueError):
+        Bulk2Api(sf).run('Out_of_service__c', 'insert', df)
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from exporters import write_chunks
+
+columns = ['Id', 'Log_Number__c', 'Chargeable__c', 'Station__c']
+
+
+def _chunks():
+    # the first chunk leaves the typed columns empty
+    return [pd.DataFrame({'Id': ['a1', 'a2'], 'Log_Number__c': [None, None],
+                          'Chargeable__c': [None, None], 'Station__c': [None, 'GRU']}),
+            pd.DataFrame({'Id': ['a3'], 'Log_Number__c': [12.0], 'Chargeable__c': [True], 'Station__c': [7]})]
+
+
+def test_csv_export_without_rows_keeps_its_header(tmp_path):
+    fname = str(tmp_path / 'export.csv')
+    write_chunks(fname, [], columns, 'csv')
+
+    assert pd.read_csv(fname).columns.tolist() == columns
+
+
+def test_parquet_columns_follow_the_salesforce_types(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    fname = str(tmp_path / 'export.parquet')
+
+    write_chunks(fname, _chunks(), columns, 'parquet',
+                 types={'Log_Number__c': 'double', 'Chargeable__c': 'boolean', 'Station__c': 'string'})
+
+    table = pq.read_table(fname)
+    assert [str(field.type) for field in table.schema] == ['string', 'double', 'bool', 'string']
+    df = table.to_pandas()
+    assert df['Log_Number__c'].tolist()[2] == 12.0
+    assert df['Chargeable__c'].tolist() == [None, None, True]
+    assert df['Station__c'].tolist() == [None, 'GRU', '7']
+
+
+def test_parquet_values_that_do_not_fit_the_first_chunk_are_converted(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    fname = str(tmp_path / 'export.parquet')
+
+    write_chunks(fname, _chunks(), columns, 'parquet')
+
+    df = pq.read_table(fname).to_pandas()
+    assert df['Log_Number__c'].tolist() == [None, None, '12.0']
+    assert df['Chargeable__c'].tolist() == [None, None, 'True']
+
+
+def test_parquet_export_without_rows_keeps_its_columns(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    fname = str(tmp_path / 'export.parquet')
+
+    write_chunks(fname, [], columns, 'parquet', types={'Log_Number__c': 'double'})
+
+    assert [field.name for field in pq.read_table(fname).schema] == columns
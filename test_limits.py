@@ -0,0 +1,26 @@
+from limits import LimitTracker
+
+
+def test_refused_limits_resource_falls_back_to_headers(fake_salesforce, sf):
+    fake_salesforce.route('GET', 'limits/', lambda request: (
+        403, 'application/json', [{'errorCode': 'INSUFFICIENT_ACCESS', 'message': 'no'}]))
+    tracker = LimitTracker()
+
+    tracker.refresh_if_stale(sf)
+    tracker.refresh_if_stale(sf)
+
+    assert fake_salesforce.paths() == ['/services/data/v42.0/limits/']
+    assert tracker.refreshed_at is not None
+    assert tracker.api_max is None and tracker.api_left() == 1.0
+
+
+def test_limits_resource_fills_the_allowances(fake_salesforce, sf):
+    fake_salesforce.route('GET', 'limits/', lambda request: (200, 'application/json', {
+        'DailyApiRequests': {'Max': 1000, 'Remaining': 900},
+        'DailyBulkApiBatches': {'Max': 100, 'Remaining': 40}}))
+    tracker = LimitTracker()
+
+    tracker.refresh(sf)
+
+    assert (tracker.api_used, tracker.api_max) == (100, 1000)
+    assert tracker.bulk_left() == 0.4
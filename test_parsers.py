@@ -0,0 +1,332 @@
+import json
+import os
+import re
+from datetime import datetime, time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+from cache import ParseCache
+from parsers import OperatorParser, Parser, excel_readers
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['Chapter', 'Mixed', 'Hours', 'Remark', 'Start', None])
+    ws.append(['05', '05', 1.0, 'NA', datetime(2020, 1, 2, 3, 4), None])
+    ws.append(['12', 'x', 2.5, 'ok', datetime(2020, 1, 3), None])
+    ws.append([None, None, None, None, None, None])
+    path = tmp_path / 'sheet.xlsx'
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('engine', ['openpyxl_streaming', 'calamine'])
+def test_readers_match_pandas(workbook, engine):
+    if engine == 'calamine':
+        pytest.importorskip('python_calamine')
+    expected = excel_readers['pandas'](workbook)
+
+    pd.testing.assert_frame_equal(excel_readers[engine](workbook), expected)
+    assert expected['Chapter'].tolist() == [5, 12]
+    assert expected['Mixed'].tolist() == ['05', 'x']
+
+
+@pytest.mark.parametrize('engine', ['openpyxl_streaming', 'calamine'])
+def test_readers_match_pandas_with_usecols_and_converters(workbook, engine):
+    if engine == 'calamine':
+        pytest.importorskip('python_calamine')
+    kwargs = {'usecols': ['Chapter', 'Start'], 'converters': {'Chapter': str}}
+    expected = excel_readers['pandas'](workbook, **kwargs)
+
+    pd.testing.assert_frame_equal(excel_readers[engine](workbook, **kwargs), expected)
+    assert expected['Chapter'].tolist() == ['05', '12']
+
+
+def test_cache_entries_are_kept_per_engine(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    cache.put('digest', Parser('.', 'X', 'pandas'), pd.DataFrame({'a': [5]}))
+
+    assert cache.get('digest', Parser('.', 'X', 'calamine')) is None
+    assert cache.get('digest', Parser('.', 'X', 'pandas'))['a'].tolist() == [5]
+
+
+def _legacy_normalize_datetime(df, c_date, c_time=None):
+    # Parser._normalize_datetime as it was before vectorizing, row by row
+    def date_format(cell):
+        if isinstance(cell, datetime):
+            return datetime.strftime(cell.date(), '%Y-%m-%d')
+        return cell
+
+    dates = df[c_date].apply(date_format)
+    s = dates + ' ' + df[c_time].astype(str) if c_time is not None else dates
+    dummy_date = '2000-01-01 12:00:00'
+    s = pd.to_datetime(s.fillna(dummy_date)).apply(datetime.isoformat) + 'Z'
+    s = s.replace(datetime.isoformat(pd.to_datetime(dummy_date)) + 'Z', np.nan)
+    return s.fillna('')
+
+
+@pytest.mark.parametrize('df, c_time', [
+    # Excel date cells next to Excel time cells
+    (pd.DataFrame({'date': pd.to_datetime(['2020-01-02', '2021-12-31 08:00']),
+                   'time': [time(3, 4, 5), time(23, 59)]}), 'time'),
+    # dates and times typed as text
+    (pd.DataFrame({'date': ['2020-01-02', '2021-12-31'], 'time': ['03:04:05', '23:59:00']}), 'time'),
+    # date-only columns, from cells and from text
+    (pd.DataFrame({'date': pd.to_datetime(['2020-01-02 10:30', '2021-12-31'])}), None),
+    (pd.DataFrame({'date': ['2020-01-02', '2021-12-31 10:30:00']}), None),
+    # a column mixing date cells and text
+    (pd.DataFrame({'date': [datetime(2020, 1, 2, 10, 30), '2021-12-31']}), None),
+])
+def test_normalize_datetime_matches_the_row_wise_version(df, c_time):
+    expected = _legacy_normalize_datetime(df.copy(), 'date', c_time)
+
+    normalized = Parser('.', 'X')._normalize_datetime(df, 'date', c_time)
+
+    assert normalized.tolist() == expected.tolist()
+
+
+def test_normalize_datetime_leaves_missing_values_blank():
+    parser = Parser('.', 'X')
+    cells = pd.DataFrame({'date': pd.to_datetime(['2020-01-02', None]), 'time': [None, time(1, 2)]})
+    text = pd.DataFrame({'date': ['2020-01-02', None, ''], 'time': [None, '01:02:00', '01:02:00']})
+
+    assert parser._normalize_datetime(cells, 'date').tolist() == ['2020-01-02T00:00:00Z', '']
+    assert parser._normalize_datetime(cells, 'date', 'time').tolist() == ['', '']
+    assert parser._normalize_datetime(text, 'date', 'time').tolist() == ['', '', '']
+
+
+@pytest.fixture
+def astana_sheet(tmp_path):
+    # a title above the header, then one A/C row per record followed by a
+    # row per extra category
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['AIR ASTANA - AOG REPORT'])
+    ws.append([])
+    ws.append(['A/C', 'START DATE', 'START TIME(UTC)', 'FINISH DATE', 'FINISH TIME(UTC)', 'AOG time',
+               'STATION', 'DEFECT', 'Rectification Action', 'CATEGORY', 'CONTRIB (%)', 'COMMENTS'])
+    ws.append([' P4-KCA', datetime(2020, 1, 2), time(3, 0), datetime(2020, 1, 3), time(5, 30),
+               datetime(1900, 1, 2, 2, 30), 'ALA', 'Leak\nat valve', 'Replaced valve',
+               'Parts Unavailability', 0.6, 'waiting for part'])
+    ws.append([None] * 9 + ['Other', 0.4, 'crew availability'])
+    ws.append(['P4-KCB', datetime(2020, 2, 10), time(22, 15), datetime(2020, 2, 11), time(1, 0),
+               datetime(1900, 1, 1, 2, 45), 'NQZ', 'Bird strike', 'Inspected',
+               'Time to receive Embraer disposition', 1, None])
+    ws.append([None] * 11 + ['no category'])
+    ws.append([None] * 9 + ['Customer Operations', 0.25, 'ops'])
+    path = tmp_path / 'astana.xlsx'
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'openpyxl_streaming'])
+def test_astana_sheet_spreads_category_rows(astana_sheet, engine):
+    with open('settings/operators/astana.json') as f:
+        parser = OperatorParser('.', 'AOG', json.load(f), engine)
+
+    df = parser.get_cleaned_df(astana_sheet)
+
+    expected = pd.DataFrame({
+        'Aircraft_Register__c': ['P4-KCA', 'P4-KCB'],
+        'Start_Date__c': ['2020-01-02T03:00:00Z', '2020-02-10T22:15:00Z'],
+        'Release_Date__c': ['2020-01-03T05:30:00Z', '2020-02-11T01:00:00Z'],
+        'OOS_Total_Time__c': [50.5, 26.75],
+        'Station__c': ['ALA', 'NQZ'],
+        'Event_Description__c': ['Leak<br>at valve', 'Bird strike'],
+        'Action_Description__c': ['Replaced valve', 'Inspected'],
+        'Others__c': ['40.0', ''],
+        'Parts_Unavailability__c': ['60.0', ''],
+        'Time_to_Receive_Embraer_Disposition__c': ['', '100.0'],
+        'Customer_Operation__c': ['', '25.0'],
+        # comments of a record are joined in category order; one without a
+        # category is dropped
+        'TechRep_Comments__c': ['crew availability<br>waiting for part', 'ops'],
+    })
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_eviction_skips_entries_removed_by_another_worker(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), max_bytes=0)
+    cache.put('digest', Parser('.', 'X'), pd.DataFrame({'a': [5]}))
+    (tmp_path / 'gone.pkl').write_bytes(b'')
+
+    real_scandir = os.scandir
+
+    def scandir(path):
+        entries = list(real_scandir(path))
+        os.remove(str(tmp_path / 'gone.pkl'))
+        return iter(entries)
+
+    monkeypatch.setattr(os, 'scandir', scandir)
+    cache.evict()
+
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_listing_skips_unreadable_and_linked_directories(tmp_path, monkeypatch):
+    for path in ['ops/OOS_DATA_1.xlsx', 'ops/2020/OOS_DATA_2.xlsx', 'ops/locked/OOS_DATA_3.xlsx',
+                 'elsewhere/OOS_DATA_4.xlsx']:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b'')
+    os.symlink(str(tmp_path / 'elsewhere'), str(tmp_path / 'ops' / 'link'))
+
+    real_scandir = os.scandir
+
+    def scandir(path):
+        if path.endswith('locked'):
+            raise PermissionError(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', scandir)
+    files = Parser(str(tmp_path / 'ops'), 'OOS_DATA').get_list_files()
+
+    assert sorted(os.path.relpath(path, str(tmp_path)) for path in files) == [
+        'ops/2020/OOS_DATA_2.xlsx', 'ops/OOS_DATA_1.xlsx']
+
+
+@pytest.fixture
+def helvetic_pattern():
+    with open('settings/operators/helvetic.json') as f:
+        extract = json.load(f)['extract']
+    return re.compile(extract['pattern'], re.IGNORECASE if extract.get('ignore_case') else 0)
+
+
+def test_helvetic_description_fields_in_one_pass(helvetic_pattern):
+    descriptions = pd.Series([
+        'Aircraft: HB-JVA; Status: Closed; Technical Event: Bleed leak\non engine 2; Solution: Replaced valve;',
+        # fields in another order and case
+        'solution: Reset CB; AOG event: No start; STATUS: Open ; aircraft:HB-JVB;',
+        # no status at all
+        'Aircraft: HB-JVC; Technical Event: Bird strike; Solution: Inspected;',
+    ])
+
+    fields = descriptions.str.extract(helvetic_pattern)
+
+    assert fields['aircraft'].str.strip().tolist() == ['HB-JVA', 'HB-JVB', 'HB-JVC']
+    assert fields['event'].tolist() == ['Bleed leak\non engine 2', 'No start', 'Bird strike']
+    assert fields['solution'].tolist() == ['Replaced valve', 'Reset CB', 'Inspected']
+    assert fields['status'].str.strip().tolist()[:2] == ['Closed', 'Open']
+    assert pd.isna(fields.loc[2, 'status'])
+
+
+def test_helvetic_description_without_any_field(helvetic_pattern):
+    fields = pd.Series(['free text only', '']).str.extract(helvetic_pattern)
+
+    assert fields.isna().all().all()
+
+
+def _operator_sheet(tmp_path, rows):
+    # kept under year and month folders, where the reference date comes from
+    path = tmp_path / '2020' / '03' / 'OOS_DATA.xlsx'
+    path.parent.mkdir(parents=True)
+    wb = openpyxl.Workbook()
+    for row in rows:
+        wb.active.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def _operator_parser(name):
+    with open('settings/operators/{}.json'.format(name)) as f:
+        return OperatorParser('.', 'OOS_DATA', json.load(f))
+
+
+def test_azul_sheet(tmp_path):
+    path = _operator_sheet(tmp_path, [
+        ['ac', 'data_inicio', 'hora_inicio', 'data_final', 'hora_final', 'defect', 'tempo_evento',
+         'station', 'chapter', 'status', 'defect_description', 'resolution_description', 'unused'],
+        [' PR-AXA', datetime(2020, 3, 1), time(10, 15), datetime(2020, 3, 2), time(8, 0), 123456, '21:45',
+         ' VCP ', '05', 'AOG ', 'Hydraulic leak\nat gear', 'Replaced seal', 'x'],
+        ['PR-AXB', datetime(2020, 3, 5), time(23, 50), datetime(2020, 3, 6), time(1, 5), 123457, '1:15',
+         'CNF', '32', 'DELAY', 'Tire worn', 'Replaced tire\nand checked pressure', None],
+    ])
+
+    df = _operator_parser('azul').get_cleaned_df(path)
+
+    expected = pd.DataFrame({
+        'Aircraft_Register__c': ['PR-AXA', 'PR-AXB'],
+        'Start_Date__c': ['2020-03-01T10:15:00Z', '2020-03-05T23:50:00Z'],
+        'Release_Date__c': ['2020-03-02T08:00:00Z', '2020-03-06T01:05:00Z'],
+        'Log_Number__c': [123456, 123457],
+        'OOS_Total_Time__c': [21.75, 1.25],
+        'Station__c': ['VCP', 'CNF'],
+        # a chapter column of numeric text is read as numbers
+        'Operator_ATA_Chapter__c': [5, 32],
+        'Event_Record_Identifier__c': ['AOG', 'DELAY'],
+        'Event_Description__c': ['Hydraulic leak<br>at gear', 'Tire worn'],
+        'Action_Description__c': ['Replaced seal', 'Replaced tire<br>and checked pressure'],
+        'Reference_Date__c': ['2020-03-01', '2020-03-01'],
+    })
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_wideroe_sheet(tmp_path):
+    path = _operator_sheet(tmp_path, [
+        ['aircraft', 'OOS_Start_Date_And_Time', 'OOS_End_Date_And_Time', 'Workordernumber',
+         'OOS_Total_Hrs_Downtime', 'station', 'workorder_ATA', 'OPS_CODE', 'Workorder_Desc_text',
+         'Workorder_Action_text', 'event_header', 'FlightNumber'],
+        ['LN-WRA', datetime(2020, 3, 1, 6, 30), datetime(2020, 3, 1, 18, 0), 998877, 11.5, ' BGO', 21,
+         ' AOG', 'Pack fault\nleft side', 'Replaced pack valve', 'Pack', 'WF123'],
+        ['WRB', '2020-03-04 07:00:00', '2020-03-04 09:30:00', 998878, 2.5, 'OSL', 34,
+         'TECH', 'ADC fail', 'Reset', 'ADC', 456],
+    ])
+
+    df = _operator_parser('wideroe').get_cleaned_df(path)
+
+    expected = pd.DataFrame({
+        'Aircraft_Register__c': ['LN-WRA', 'LN-WRB'],
+        # date cells count for their day only, as they always did
+        'Start_Date__c': ['2020-03-01T00:00:00Z', '2020-03-04T00:00:00Z'],
+        'Release_Date__c': ['2020-03-01T00:00:00Z', '2020-03-04T00:00:00Z'],
+        'Log_Number__c': [998877, 998878],
+        'OOS_Total_Time__c': [11.5, 2.5],
+        'Station__c': ['BGO', 'OSL'],
+        'Operator_ATA_Chapter__c': [21, 34],
+        'Event_Record_Identifier__c': ['AOG', 'TECH'],
+        'Event_Description__c': ['Pack fault<br>left side', 'ADC fail'],
+        'Action_Description__c': ['Replaced pack valve', 'Reset'],
+        'Header__c': ['Pack', 'ADC'],
+        'Flight_Number__c': ['WF123', '456'],
+        'Reference_Date__c': ['2020-03-01', '2020-03-01'],
+    })
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_helvetic_sheet(tmp_path):
+    path = _operator_sheet(tmp_path, [
+        ['Description', 'Occurrence Date', 'Occurrence Time', 'Ready Date', 'Ready Time',
+         'Workorder Number', 'Repair Station', 'ATA Chapter', 'Workorder Text', 'Workorder Action',
+         'Header', 'Event Flight Number'],
+        ['Aircraft: HB-JVA; Status: Closed; Technical Event: Bleed leak\non engine 2; Solution: Replaced valve;',
+         datetime(2020, 3, 1), time(5, 0), datetime(2020, 3, 1), time(17, 30), 4711, ' ZRH ', 36,
+         None, None, 'Bleed', 'LX8000'],
+        ['Aircraft: HB-JVB; AOG Event: No start; Solution: Reset CB;',
+         datetime(2020, 3, 2), time(22, 0), datetime(2020, 3, 3), time(2, 15), 0, 'GVA', 80,
+         'Starter inop', 'Replaced starter\nran engine', 'Start', 2130],
+    ])
+
+    df = _operator_parser('helvetic').get_cleaned_df(path)
+
+    expected = pd.DataFrame({
+        'Aircraft_Register__c': ['HB-JVA', 'HB-JVB'],
+        'Start_Date__c': ['2020-03-01T05:00:00Z', '2020-03-02T22:00:00Z'],
+        'Release_Date__c': ['2020-03-01T17:30:00Z', '2020-03-03T02:15:00Z'],
+        'OOS_Total_Time__c': [12.5, 4.25],
+        # a field missing from the description stays empty
+        'Event_Record_Identifier__c': ['Closed', np.nan],
+        'Log_Number__c': [4711.0, np.nan],
+        'Station__c': ['ZRH', 'GVA'],
+        'Operator_ATA_Chapter__c': [36, 80],
+        # the workorder texts win over the description when they are filled
+        'Event_Description__c': ['Bleed leak<br>on engine 2', 'Starter inop'],
+        'Action_Description__c': ['Replaced valve', 'Replaced starter<br>ran engine'],
+        'Header__c': ['Bleed', 'Start'],
+        'Flight_Number__c': ['LX8000', '2130'],
+        'Reference_Date__c': ['2020-03-01', '2020-03-01'],
+    })
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pandas as pd
+
+from reference import ReferenceCache
+
+
+class FakeApi:
+
+    def __init__(self):
+        self.pages = []
+        self.soqls = []
+
+    def query(self, soql, include_deleted=False):
+        assert include_deleted
+        self.soqls.append(soql)
+        records = self.pages.pop(0)
+        return pd.DataFrame(records) if records else None
+
+
+def _record(record_id, registration, stamp, deleted=False):
+    return {'Id': record_id, 'Registration__c': registration, 'IsDeleted': deleted,
+            'SystemModstamp': stamp}
+
+
+def test_refresh_drops_cleared_and_deleted_records(tmp_path):
+    sf_api = FakeApi()
+    references = ReferenceCache(sf_api, str(tmp_path / 'history.db'))
+    sf_api.pages = [
+        [_record('a1', 'PR-AAA', '2020-01-01T00:00:00.000+0000'),
+         _record('a2', 'PR-BBB', '2020-01-01T00:00:00.000+0000'),
+         _record('a3', 'PR-CCC', '2020-01-01T00:00:00.000+0000')],
+        [_record('a1', None, '2020-01-02T00:00:00.000+0000'),
+         _record('a2', 'PR-BBB', '2020-01-02T00:00:00.000+0000', deleted=True),
+         _record('a3', 'PR-DDD', '2020-01-02T00:00:00.000+0000')],
+    ]
+
+    references.refresh('Aircraft__c')
+    references.refresh('Aircraft__c')
+
+    assert references.ids('Aircraft__c').values.tolist() == [['PR-DDD', 'a3']]
+    assert 'WHERE' not in sf_api.soqls[0]
+    df, unknown = references.resolve(pd.DataFrame({'reg': ['PR-AAA', 'PR-DDD']}), 'reg', 'Aircraft__c', 'Id')
+    assert df['Id'].tolist()[1] == 'a3'
+    assert unknown['reg'].tolist() == ['PR-AAA']
+    references.close()
+
+
+def test_refresh_is_incremental_until_the_sync_gets_old(tmp_path):
+    sf_api = FakeApi()
+    references = ReferenceCache(sf_api, str(tmp_path / 'history.db'))
+    # an object that rarely changes keeps an old newest stamp
+    sf_api.pages = [[_record('a1', 'PR-AAA', '2020-01-01T00:00:00.000+0000')], [],
+                    [_record('a2', 'PR-BBB', '2020-01-01T00:00:00.000+0000')]]
+
+    references.refresh('Aircraft__c')
+    references.refresh('Aircraft__c')
+    assert sf_api.soqls[1].endswith('WHERE SystemModstamp > 2020-01-01T00:00:00Z')
+
+    # a sync older than the recycle bin keeps deleted records is redone whole
+    references.conn.execute("UPDATE reference_sync SET synced_at = '2020-01-01T00:00:00'")
+    references.refresh('Aircraft__c')
+    assert 'WHERE' not in sf_api.soqls[2]
+    assert references.ids('Aircraft__c').values.tolist() == [['PR-BBB', 'a2']]
+    references.close()
+
+
+def test_caches_without_sync_time_are_reloaded(tmp_path):
+    path = str(tmp_path / 'history.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE reference_sync (object TEXT PRIMARY KEY, last_sync TEXT)')
+    conn.execute("INSERT INTO reference_sync VALUES ('Aircraft__c', '2020-01-01T00:00:00Z')")
+    conn.commit()
+    conn.close()
+
+    references = ReferenceCache(FakeApi(), path)
+
+    assert references.last_sync('Aircraft__c') is None
+    references.close()
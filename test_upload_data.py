@@ -0,0 +1,113 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from history import HistoryStore
+from journal import UploadJournal, chunk_hash, write_checkpointed
+from upload_data import abandon_operator_run, upload_operator_run
+
+
+@pytest.fixture
+def stores(tmp_path):
+    db = str(tmp_path / 'history.db')
+    history = HistoryStore(db, str(tmp_path / 'missing.txt'))
+    journal = UploadJournal(db, str(tmp_path / 'runs'))
+    yield history, journal
+    history.close()
+    journal.close()
+
+
+def _start_run(history, journal):
+    analyzed_files = [('a.xlsx', 'h1', 'azul', 1), ('b.xlsx', 'h2', 'azul', 1)]
+    run_id = journal.start('operator_import', pd.DataFrame({'Header__c': ['x', 'y']}),
+                           {'analyzed_files': analyzed_files})
+    for fname, digest, parser_name, _ in analyzed_files:
+        history.record(fname, digest, parser_name, 'pending', run_id)
+    return run_id
+
+
+def test_run_without_its_records_is_reported_and_failed(stores, capsys):
+    history, journal = stores
+    run_id = _start_run(history, journal)
+    os.remove(journal._data_path(run_id))
+
+    upload_operator_run(None, history, journal, run_id)
+
+    assert 'UPLOAD: FAILED' in capsys.readouterr().out
+    assert journal.open_runs('operator_import') == []
+    assert not history.contains('a.xlsx') and not history.contains('b.xlsx')
+
+
+def test_abandoned_run_releases_its_files(stores):
+    history, journal = stores
+    run_id = _start_run(history, journal)
+    assert history.contains('a.xlsx')
+
+    abandon_operator_run(history, journal, run_id)
+
+    assert journal.open_runs('operator_import') == []
+    assert not os.path.isfile(journal._data_path(run_id))
+    assert history.find_hash('h1') is None and history.find_hash('h2') is None
+    assert journal.conn.execute('SELECT state FROM upload_runs').fetchall() == [('abandoned',)]
+
+
+def test_unknown_aircraft_are_reported_with_their_file_row(stores, capsys):
+    history, journal = stores
+    analyzed_files = [('dir/a.xlsx', 'h1', 'azul', 2), ('dir/empty.xlsx', 'h2', 'azul', 0),
+                      ('dir/b.xlsx', 'h3', 'azul', 3)]
+    df = pd.DataFrame({'Aircraft_Register__c': ['PR-A', 'PR-B', 'PR-C', 'PR-D', 'PR-E'],
+                       'Serial_Number__c': [None] * 5})
+    run_id = journal.start('operator_import', df, {'analyzed_files': analyzed_files})
+
+    upload_operator_run(None, history, journal, run_id)
+
+    out = capsys.readouterr().out
+    assert 'UNKNOWN AIRCRAFT REGISTRATION PR-B (ROW 2 OF A.XLSX)' in out
+    assert 'UNKNOWN AIRCRAFT REGISTRATION PR-C (ROW 1 OF B.XLSX)' in out
+    assert 'UNKNOWN AIRCRAFT REGISTRATION PR-E (ROW 3 OF B.XLSX)' in out
+
+
+def _collections(fake_salesforce):
+    # answers every sObject Collections insert with one id per record
+    def insert(request):
+        records = json.loads(request['body'])['records']
+        return 200, 'application/json', [{'success': True, 'id': record['Header__c']} for record in records]
+
+    fake_salesforce.routes[('POST', '/services/data/v46.0/composite/sobjects/')] = insert
+
+
+def test_small_inserts_journal_each_collections_call(stores, fake_salesforce, sf_api):
+    _, journal = stores
+    _collections(fake_salesforce)
+    df = pd.DataFrame({'Header__c': ['h{}'.format(i) for i in range(450)]})
+    run_id = journal.start('operator_import')
+
+    out = write_checkpointed(sf_api, journal, run_id, 'Out_of_service__c', 'insert', df)
+
+    assert [r['id'] for r in out] == list(df['Header__c'])
+    assert len(fake_salesforce.paths('POST')) == 3
+    assert not any('jobs/ingest' in path for path in fake_salesforce.paths())
+    for n in range(3):
+        assert journal.chunk(run_id, 'Out_of_service__c:insert:0:{}'.format(n))['state'] == 'done'
+
+
+def test_resumed_insert_sends_only_the_calls_not_started(stores, fake_salesforce, sf_api):
+    _, journal = stores
+    _collections(fake_salesforce)
+    df = pd.DataFrame({'Header__c': ['h{}'.format(i) for i in range(450)]})
+    run_id = journal.start('operator_import')
+    chunk_id = 'Out_of_service__c:insert:0'
+    journal.save_chunk(run_id, chunk_id, chunk_hash(df), [], 'pending')
+    done = [{'success': True, 'created': True, 'id': 'kept', 'errors': []}] * 200
+    journal.save_chunk(run_id, chunk_id + ':0', chunk_hash(df.iloc[:200]), [], 'done', done)
+    journal.save_chunk(run_id, chunk_id + ':1', chunk_hash(df.iloc[200:400]), [], 'pending')
+
+    out = write_checkpointed(sf_api, journal, run_id, 'Out_of_service__c', 'insert', df)
+
+    # the call in doubt is reported rather than sent twice
+    assert len(fake_salesforce.paths('POST')) == 1
+    assert [r['id'] for r in out[:200]] == ['kept'] * 200
+    assert all(r['errors'][0].startswith('INTERRUPTED') for r in out[200:400])
+    assert [r['id'] for r in out[400:]] == list(df['Header__c'][400:])
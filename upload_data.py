@@ -1,25 +1,40 @@
+import argparse
+import bisect
 import json
 import pandas as pd
 import os
 import re
 
 from simple_salesforce import Salesforce, SalesforceLogin, SFType
-from api import SFApi
+from api import SFApi, read_preferences
 import parsers as ps
+from cache import ParseCache
+from history import HistoryStore, ScanSnapshot
+from reference import ReferenceCache
+from snapshot import ExportBaseline, RecordSnapshot, export_objects
+from exporters import is_id_column, order_columns, write_chunks
+from stages import StageError, print_timings, run_stages
+from journal import UploadJournal, write_checkpointed
 from datetime import datetime
 import openpyxl as op
 
 
-def dict_from_df(df):
-    if isinstance(df, pd.Series):
-        df = df.to_frame()
-    records_dict = df.to_dict('records')
-    for record in records_dict:
-        coppied_record = record.copy()
-        for key, value in coppied_record.items():
-            if value is None or value == '':
-                del record[key]
-    return records_dict
+# child relationship names of the association objects on Out_of_service__c
+fc_relationship = 'FC_OOS_Associations__r'
+rc_relationship = 'RC_OOS_Associations__r'
+export_code_fields = ['Fail_Code__r.Id', 'Fail_Code__r.Name', 'Fail_Code__r.ATA__c', 'Fail_Code__r.Technology__c',
+                      'Root_Code__r.Name', 'Root_Code__r.ATA__c', 'Root_Code__r.Supplier__r.Name']
+
+
+def export_field_types(sf_api):
+    # typed exports take their column types from Salesforce rather than
+    # from whatever the first rows happen to hold
+    types = {}
+    for prefix, obj_api in [('', 'Out_of_service__c'), ('Fail_Code__r.', 'Fail_Codes__c'),
+                            ('Root_Code__r.', 'Root_Codes__c'), ('Root_Code__r.Supplier__r.', 'Supplier__c')]:
+        for name, sf_type in sf_api.field_types(obj_api).items():
+            types[prefix + name] = sf_type
+    return types
 
 
 def split_dataframe(df_new, df, col, remove_prefix):
@@ -30,115 +45,216 @@ def split_dataframe(df_new, df, col, remove_prefix):
     return df_new
 
 
-def auto_update_records_from_operators_sheets():
-    records = []
-    ac_registers = []
+def print_limits(sf_api):
+    metrics = sf_api.limit_metrics()
+    print('API REQUESTS: {}/{} ({} throttled)'.format(
+        metrics['api_used'], metrics['api_max'], metrics['throttled_calls']))
+    print('BULK BATCHES LEFT: {}/{}'.format(
+        metrics['bulk_batches_remaining'], metrics['bulk_batches_max']))
+
+
+def abandon_operator_run(history, journal, run_id, state='abandoned'):
+    # the files of the run count as failed, so the next import parses
+    # and uploads them again
+    _, meta = journal.load(run_id)
+    for fname, digest, parser_name, _ in meta['analyzed_files']:
+        history.record(fname, digest, parser_name, 'failed', run_id)
+    journal.finish(run_id, state)
+
+
+def upload_operator_run(sf_api, history, journal, run_id):
+    df_records, meta = journal.load(run_id)
+    analyzed_files = meta['analyzed_files']
+    if df_records is None:
+        problems = ['the parsed records of interrupted upload {} are missing, its sheets will be imported again'.format(
+            run_id)]
+        job_ids = journal.job_ids(run_id)
+        if len(job_ids) > 0:
+            problems.append('records it inserted through bulk jobs {} may be uploaded twice'.format(
+                ', '.join(job_ids)))
+        abandon_operator_run(history, journal, run_id, 'failed')
+        print('UPLOAD: FAILED')
+        print('PROBLEM:\n\t' + '\n\t'.join(problem.upper() for problem in problems))
+        return
+
+    unknown = df_records[df_records['Serial_Number__c'].isna()]
+
+    # rows without a known aircraft are reported instead of uploaded,
+    # with their row in the file they came from
+    starts = []
+    start = 0
+    for _, _, _, n_records in analyzed_files:
+        starts.append(start)
+        start += n_records
+    results = [None] * len(df_records)
+    for idx, register in unknown['Aircraft_Register__c'].items():
+        file_idx = bisect.bisect_right(starts, idx) - 1
+        results[idx] = {'success': False, 'created': False, 'id': None,
+                        'errors': ['unknown aircraft registration {} (row {} of {})'.format(
+                            register, idx - starts[file_idx] + 1,
+                            os.path.basename(analyzed_files[file_idx][0]))]}
+
+    df_known = df_records.drop(index=unknown.index).drop(columns=['Aircraft_Register__c'])
+    for idx, result in zip(df_known.index, write_checkpointed(
+            sf_api, journal, run_id, 'Out_of_service__c', 'insert', df_known)):
+        results[idx] = result
+
+    job_id = ','.join(journal.job_ids(run_id)) or None
+    start = 0
+    for fname, digest, parser_name, n_records in analyzed_files:
+        n_failed = sum(len(result['errors']) > 0
+                       for result in results[start:start + n_records])
+        start += n_records
+        status = 'uploaded' if n_failed == 0 else 'partial' if n_failed < n_records else 'failed'
+        history.record(fname, digest, parser_name, status, job_id)
+    journal.finish(run_id)
+
+    errors = []
+    for result in results:
+        if len(result['errors']) > 0:
+            errors.append(', '.join(result['errors']).upper())
+    if len(errors) > 0:
+        print('UPLOAD: FAILED')
+        print('PROBLEM:\n\t'+'\n\t'.join(errors))
+    else:
+        print('UPLOAD: SUCCESS')
+
+
+def auto_update_records_from_operators_sheets(workers=None, resume=False, abandon=False):
+    frames = []
     analyzed_files = []
-    for parser_model in [ps.AzulParser, ps.WideroeParser, ps.HelveticParser, ps.AstanaParser]:
-        p = parser_model('../1 - OPERADORES/1 - Dados recebidos', 'OOS_DATA')
-        for fname in p.get_unprocessed_files():
-            analyzed_files.append(fname.replace('ø', 'o').replace('@', 'a'))
-            df = p.get_cleaned_df(fname).fillna('')
-            ac_registers.extend(df['Aircraft_Register__c'].tolist())
-            records.extend(dict_from_df(df))
-
-    ac_registers = tuple(set(ac_registers))
-    if len(records) > 0:
+    jobs = []
+    history = HistoryStore()
+    journal = UploadJournal()
+    interrupted = journal.open_runs('operator_import')
+    if abandon:
+        for run_id in interrupted:
+            abandon_operator_run(history, journal, run_id)
+        print('{} interrupted upload(s) abandoned, their sheets are imported again'.format(len(interrupted)))
+        interrupted = []
+
+    if resume:
+        # interrupted runs carry their parsed records, nothing is read again
+        runs = interrupted
+    else:
+        if len(interrupted) > 0:
+            print('{} interrupted upload(s) pending, run with --resume to finish them '
+                  'or --abandon to import their sheets again'.format(len(interrupted)))
+        snapshot = ScanSnapshot()
+        engine = read_preferences().get('excel_engine', 'pandas')
+        for p in ps.load_operator_parsers('../1 - OPERADORES/1 - Dados recebidos', 'OOS_DATA', engine):
+            for fname in p.get_unprocessed_files(history, snapshot):
+                jobs.append((p, fname))
+
+        parse_errors = []
+        seen_hashes = set()
+        for (p, _), (fname, digest, df, error) in zip(jobs, ps.parse_files(jobs, workers, ParseCache())):
+            if error is not None:
+                parse_errors.append('{}\n\t\t{}'.format(fname, error))
+                continue
+            # the same workbook delivered again under another name
+            if digest in seen_hashes or history.find_hash(digest) is not None:
+                history.record(fname, digest, p.name, 'duplicate')
+                continue
+            seen_hashes.add(digest)
+            analyzed_files.append((fname, digest, p.name, len(df)))
+            frames.append(df)
+
+        if len(parse_errors) > 0:
+            print('PARSE: FAILED')
+            print('PROBLEM:\n\t'+'\n\t'.join(parse_errors))
+        runs = []
+
+    if len(frames) > 0 or len(runs) > 0:
         print('--- STATUS ---')
         sf_api = SFApi()
         sf_api.connect()
 
-        ac_ids = sf_api.query(
-            "SELECT Registration__c, Id FROM Aircraft__c WHERE Registration__c IN {}".format(ac_registers))
-
-        ac_ids = dict(zip(ac_ids['Registration__c'], ac_ids['Id']))
-
-        for record in records:
-            record['Serial_Number__c'] = ac_ids[record['Aircraft_Register__c']]
-            del record['Aircraft_Register__c']
-
-        results = sf_api.insert('Out_of_service__c', records)
-        with open('settings/history_files.txt', 'a+') as f:
-            f.write('\n'.join(analyzed_files) + '\n')
-
-        errors = []
-        for result in results:
-            if len(result['errors']) > 0:
-                errors.append(result['errors'].upper())
-        if len(errors) > 0:
-            print('UPLOAD: FAILED')
-            print('PROBLEM:\n\t'+'\n\t'.join(errors))
-        else:
-            print('UPLOAD: SUCCESS')
-
+        if len(frames) > 0:
+            df_records = pd.concat(frames, ignore_index=True, sort=False)
+            references = ReferenceCache(sf_api)
+            references.refresh('Aircraft__c')
+            df_records, _ = references.resolve(
+                df_records, 'Aircraft_Register__c', 'Aircraft__c', 'Serial_Number__c')
+            references.close()
+
+            # the files count as taken from here on, a crash leaves them
+            # to --resume instead of to a second, duplicating upload
+            run_id = journal.start('operator_import', df_records, {'analyzed_files': analyzed_files})
+            for fname, digest, parser_name, _ in analyzed_files:
+                history.record(fname, digest, parser_name, 'pending', run_id)
+            runs = [run_id]
+
+        for run_id in runs:
+            upload_operator_run(sf_api, history, journal, run_id)
+
+        print_limits(sf_api)
         print('--------------')
 
     else:
         print('Everything is up-to-date!')
+    journal.close()
 
 
-def download_records_as_sheet():
+def download_records_as_sheet(incremental=False, fmt='xlsx'):
     sf_api = SFApi()
     sf_api.connect()
 
-    df = sf_api.query(
-        '''
-            SELECT Id, Aircraft_Register__c, Project__c, Operator__c, Station__c, Flight_Number__c,
-            Event_Record_Identifier__c, Inter_ID__c, Log_Number__c, Reference_Date__c, Header__c, Event_Description__c,
-            Action_Description__c, Start_Date__c, Release_Date__c, OOS_Total_Time__c, Chargeable__c, Exclusion_Code__c,
-            Dispatched_On_MEL__c, Remove_Availability_Market__c, Parts_Unavailability__c, Customer_Operation__c,
-            Time_to_Receive_Supplier_Disposition__c, Time_to_Receive_Embraer_Disposition__c, Expected_Time_For_Troubleshooting__c,
-            Others__c, TechRep_Comments__c, Solution_Description__c, Solution_Release_Date__c, Issue_Status__c,
-            Before_Event_Date__c, PCR__c, EPR__c, JIRA__c, eFleet__c, CMC_Message__c, EFTC_Comments__c,
-            Component_Serial_Number__c, Component_Part_Number__c FROM Out_of_service__c
-        ''')
-
-    df_fc = sf_api.query('''
-                         SELECT Fail_Code__r.Id, Fail_Code__r.Name, Fail_Code__r.ATA__c, Fail_Code__r.Technology__c,
-                         Out_of_service__r.Id FROM FC_OOS_Association__c WHERE Out_of_service__c IN (\'{}\')
-                         '''.format('\', \''.join(df.Id.to_numpy())))
-
-    df_fc = df_fc.groupby(by=['Out_of_service__r.Id']).first()
-    df = pd.merge(df, df_fc, how='left', left_on='Id',
-                  right_on='Out_of_service__r.Id')
-
-    df_rc = sf_api.query('''
-                         SELECT Root_Code__r.Name, Root_Code__r.ATA__c, Root_Code__r.Supplier__r.Name,
-                         Out_of_service__r.Id FROM RC_OOS_Association__c WHERE Out_of_service__c IN (\'{}\')
-                         '''.format('\', \''.join(df.Id.to_numpy())))
-
-    df_rc = df_rc.groupby(by=['Out_of_service__r.Id']).first()
-
-    df = pd.merge(df, df_rc, how='left', left_on='Id',
-                  right_on='Out_of_service__r.Id')
-
-    cols = list(df.columns)
-    for c_name in ['Fail_Code__r.Id', 'Fail_Code__r.Name', 'Fail_Code__r.ATA__c', 'Fail_Code__r.Technology__c']:
-        cols.pop(cols.index(c_name))
-        # print(cols.index('Solution_Description__c'))
-        cols.insert(cols.index('Solution_Description__c'), c_name)
-
-    df[cols].to_excel('EXPORTED_OOS_DATA_' +
-                      re.sub(r'[^A-z0-9_]', '_', datetime.now().isoformat()
-                             ) + '.xlsx', index=False)
-
-    # SAVE
-    # writer = pd.ExcelWriter('EXPORTED_OOS_DATA_' +
-    #                         re.sub(r'[^A-z0-9_]', '_', datetime.now().isoformat()
-    #                                ) + '.xlsx', engine='openpyxl')
-
-    # df.to_excel(writer, index=False)
-    # workbook = writer.book
-    # worksheet = writer.sheets['Sheet1']
-    # for idx, col in enumerate(df.columns):
-    #     if re.findall(r'(id)$', col, re.IGNORECASE):
-    #         worksheet.column_dimensions[op.utils.get_column_letter(
-    #             idx+1)].hidden = True
-
-    # writer.save()
-
-
-def upload_modified_sheet(fname):
+    if incremental:
+        # only changes since the last export are fetched, the sheet itself
+        # is rebuilt from the local snapshot
+        snapshot = RecordSnapshot(sf_api)
+        snapshot.sync_all()
+        df, df_fc, df_rc = snapshot.export_frames()
+        snapshot.close()
+
+        df_fc = df_fc.groupby(by=['Out_of_service__r.Id']).first()
+        df = pd.merge(df, df_fc, how='left', left_on='Id',
+                      right_on='Out_of_service__r.Id')
+
+        df_rc = df_rc.groupby(by=['Out_of_service__r.Id']).first()
+
+        df = pd.merge(df, df_rc, how='left', left_on='Id',
+                      right_on='Out_of_service__r.Id')
+        chunks = [df]
+    else:
+        # the associations come along as subqueries, each flattened as the
+        # first associated code, and every page is written as it arrives
+        chunks = sf_api.iter_query('''
+                                   SELECT Id, {},
+                                   (SELECT Fail_Code__r.Id, Fail_Code__r.Name, Fail_Code__r.ATA__c, Fail_Code__r.Technology__c
+                                   FROM {}),
+                                   (SELECT Root_Code__r.Name, Root_Code__r.ATA__c, Root_Code__r.Supplier__r.Name
+                                   FROM {})
+                                   FROM Out_of_service__c
+                                   '''.format(', '.join(export_objects['Out_of_service__c']),
+                                              fc_relationship, rc_relationship))
+        chunks = (chunk.rename(columns=lambda col: re.sub(
+            r'^({}|{})\.'.format(fc_relationship, rc_relationship), '', col)) for chunk in chunks)
+
+    columns = order_columns(['Id'] + export_objects['Out_of_service__c'] + export_code_fields,
+                            export_code_fields[:4], 'Solution_Description__c')
+
+    fname = 'EXPORTED_OOS_DATA_' + re.sub(r'[^A-z0-9_]', '_', datetime.now().isoformat()) + '.' + fmt
+    # what the sheet held at export time, so an upload can send only edits
+    baseline = ExportBaseline()
+    try:
+        chunks = (chunk.reindex(columns=columns) for chunk in chunks)
+        return write_chunks(fname, baseline.track(fname, chunks), columns, fmt,
+                            [col for col in columns if is_id_column(col)],
+                            export_field_types(sf_api) if fmt == 'parquet' else None)
+    finally:
+        baseline.close()
+
+
+def blank_unchanged(df_part, changed, prefix=''):
+    # unchanged cells go out blank, which the Bulk API leaves untouched
+    unchanged = ~changed.loc[df_part.index, [prefix + col for col in df_part.columns]].to_numpy()
+    unchanged[:, list(df_part.columns).index('Id')] = False
+    return df_part.mask(unchanged, '')
+
+
+def upload_modified_sheet(fname, dry_run=False, resume=False, abandon=False):
     sf_api = SFApi()
     sf_api.connect()
 
@@ -161,6 +277,15 @@ def upload_modified_sheet(fname):
         else:
             df_oos = split_dataframe(df_oos, df, col, '')
 
+    # only rows and cells edited since the export go back to Salesforce;
+    # a sheet without a recorded export is sent whole, as before
+    baseline = ExportBaseline()
+    if baseline.has_export(os.path.basename(fname)):
+        changed = baseline.changed_cells(os.path.basename(fname), df)
+    else:
+        changed = pd.DataFrame(True, index=df.index, columns=df.columns)
+    baseline.close()
+
     df_supplier.dropna(inplace=True)
     df_root_code = df_root_code.dropna(axis=0, how='all').fillna('')
     df_fail_code = df_fail_code.dropna(axis=0, how='all').fillna(
@@ -168,52 +293,165 @@ def upload_modified_sheet(fname):
     df_oos = df_oos.dropna(axis=0, how='all').fillna('').drop(columns=[
         'Operator__c', 'Before_Event_Date__c', 'Project__c', 'Remove_Availability_Market__c', 'Aircraft_Register__c'])
 
-    # supplier upsert
-    records_supplier = dict_from_df(df_supplier)
-    results = sf_api.upsert('Supplier__c', records_supplier, 'Name')
-    df_name_and_id = pd.concat([pd.DataFrame(results).apply(pd.Series),
-                                df_supplier.reset_index(drop=True)], axis=1, sort=False)[['id', 'Name']].rename(columns={'id': 'Supplier__r.Id', 'Name': 'Supplier__r.Name'})
-
-    # root code upsert
-    df_root_code['ATA__c'] = df_root_code['ATA__c'].astype(
-        int).astype(str).apply(lambda x: '0' + x if len(x) == 1 else x)
-
-    df_rc_oos_association = df_root_code.copy()
-
-    df_root_code = pd.merge(df_root_code, df_name_and_id, how='left',
-                            on='Supplier__r.Name').drop(columns=['Supplier__r.Name']).rename(columns={'Supplier__r.Id': 'Supplier__c'})
-
-    records_root_code = dict_from_df(df_root_code)
-    results_root_code = sf_api.upsert(
-        'Root_Codes__c', records_root_code, 'Name')
-
-    # root code and oos association insert
-    df_results_root_code = pd.DataFrame(results_root_code).apply(pd.Series)
-    df_rc_oos_association = pd.concat([
-        df['Id'], df_rc_oos_association], axis=1, join='inner').reset_index(drop=True).rename(columns={'Id': 'Out_of_service__c'})
-    df_rc_oos_association = pd.concat([
-        df_results_root_code, df_rc_oos_association], sort=False, axis=1).rename(columns={'id': 'Root_Code__c'})
-
-    df_new_associations = df_rc_oos_association[df_rc_oos_association['created'] == True][[
-        'Root_Code__c', 'Out_of_service__c']]
-
-    if len(df_new_associations) > 0:
-        results_rc_oos_association = sf_api.insert(
-            'RC_OOS_Association__c', dict_from_df(df_new_associations))
-        print(results_rc_oos_association)
-
-    # fail code update
-    df_fail_code['ATA__c'] = df_fail_code['ATA__c'].astype(
-        int).astype(str).apply(lambda x: '0' + x if len(x) == 1 else x)
-    records_fail_code = dict_from_df(df_fail_code)
-    results_fail_code = sf_api.update(
-        'Fail_Codes__c', records_fail_code)
-
-    # oos update
-    records_oos = dict_from_df(df_oos)
-    results_oos = sf_api.update(
-        'Out_of_service__c', records_oos)
-
-
-# download_records_as_sheet()
-upload_modified_sheet('EXPORTED_OOS_DATA_2020_09_30T13_46_44_748803.xlsx')
+    # root codes are upserted by Name, so a changed row is sent whole,
+    # together with its supplier
+    rc_changed = changed[['Root_Code__r.' + col for col in df_root_code.columns]].any(axis=1)
+    df_root_code = df_root_code[rc_changed.loc[df_root_code.index]]
+    df_supplier = df_supplier[rc_changed.loc[df_supplier.index]]
+
+    fc_changed = changed[['Fail_Code__r.' + col for col in df_fail_code.columns if col != 'Id']].any(axis=1)
+    df_fail_code = df_fail_code[fc_changed.loc[df_fail_code.index]]
+
+    oos_changed = changed[[col for col in df_oos.columns if col != 'Id']].any(axis=1)
+    df_oos = blank_unchanged(df_oos[oos_changed.loc[df_oos.index]], changed)
+
+    print('--- CHANGES ---')
+    print('Supplier__c: {} upserts'.format(len(df_supplier)))
+    print('Root_Codes__c: {} upserts'.format(len(df_root_code)))
+    print('Fail_Codes__c: {} updates, {} fields'.format(
+        len(df_fail_code), int(changed.loc[df_fail_code.index, ['Fail_Code__r.' + col for col in df_fail_code.columns if col != 'Id']].to_numpy().sum())))
+    print('Out_of_service__c: {} updates, {} fields'.format(
+        len(df_oos), int((df_oos.drop(columns=['Id']) != '').to_numpy().sum())))
+    print('---------------')
+    if dry_run:
+        return
+
+    # chunks already sent by an interrupted upload of this sheet are
+    # taken from the journal instead of being sent again
+    journal = UploadJournal()
+    kind = 'sheet_upload:' + os.path.basename(fname)
+    interrupted = journal.open_runs(kind)
+    if abandon:
+        for run_id in interrupted:
+            journal.finish(run_id, 'abandoned')
+        interrupted = []
+    if resume and len(interrupted) > 0:
+        run_id = interrupted[-1]
+    else:
+        if len(interrupted) > 0:
+            print('{} interrupted upload(s) of this sheet pending, run with --resume to finish them '
+                  'or --abandon to drop them'.format(len(interrupted)))
+        run_id = journal.start(kind)
+
+    def write(obj_api, operation, df_write, external_id=None):
+        return write_checkpointed(sf_api, journal, run_id, obj_api, operation, df_write, external_id)
+
+    def upsert_suppliers(done):
+        # a supplier row carries nothing but its Name, so known suppliers
+        # are taken from the reference cache and only new ones upserted
+        references = ReferenceCache(sf_api)
+        try:
+            references.refresh('Supplier__c')
+            df_suppliers, df_new = references.resolve(
+                df_supplier[['Name']].drop_duplicates(), 'Name', 'Supplier__c', 'Supplier__r.Id')
+        finally:
+            references.close()
+
+        df_new = df_new[['Name']].reset_index(drop=True)
+        if len(df_new) > 0:
+            results = write('Supplier__c', 'upsert', df_new, 'Name')
+            df_new['Supplier__r.Id'] = pd.DataFrame(results)['id'].to_numpy()
+        return pd.concat([df_suppliers.dropna(subset=['Supplier__r.Id']), df_new], ignore_index=True, sort=False)[
+            ['Supplier__r.Id', 'Name']].rename(columns={'Name': 'Supplier__r.Name'})
+
+    def upsert_root_codes(done):
+        df_name_and_id = done['suppliers']
+        df_root_codes = df_root_code.copy()
+        df_root_codes['ATA__c'] = df_root_codes['ATA__c'].astype(
+            int).astype(str).apply(lambda x: '0' + x if len(x) == 1 else x)
+
+        df_rc_oos_association = df_root_codes.copy()
+
+        df_root_codes = pd.merge(df_root_codes, df_name_and_id, how='left',
+                                 on='Supplier__r.Name').drop(columns=['Supplier__r.Name']).rename(columns={'Supplier__r.Id': 'Supplier__c'})
+
+        results_root_code = write(
+            'Root_Codes__c', 'upsert', df_root_codes, 'Name')
+        return results_root_code, df_rc_oos_association
+
+    def insert_rc_associations(done):
+        results_root_code, df_rc_oos_association = done['root_codes']
+        df_results_root_code = pd.DataFrame(results_root_code).apply(pd.Series)
+        df_rc_oos_association = pd.concat([
+            df['Id'], df_rc_oos_association], axis=1, join='inner').reset_index(drop=True).rename(columns={'Id': 'Out_of_service__c'})
+        df_rc_oos_association = pd.concat([
+            df_results_root_code, df_rc_oos_association], sort=False, axis=1).rename(columns={'id': 'Root_Code__c'})
+
+        df_new_associations = df_rc_oos_association[df_rc_oos_association['created'] == True][[
+            'Root_Code__c', 'Out_of_service__c']]
+
+        if len(df_new_associations) > 0:
+            results_rc_oos_association = write(
+                'RC_OOS_Association__c', 'insert', df_new_associations)
+            print(results_rc_oos_association)
+            return results_rc_oos_association
+
+    def update_fail_codes(done):
+        df_fail_codes = df_fail_code.copy()
+        df_fail_codes['ATA__c'] = df_fail_codes['ATA__c'].astype(
+            int).astype(str).apply(lambda x: '0' + x if len(x) == 1 else x)
+        return write(
+            'Fail_Codes__c', 'update', blank_unchanged(df_fail_codes, changed, 'Fail_Code__r.'))
+
+    def update_oos(done):
+        return write(
+            'Out_of_service__c', 'update', df_oos)
+
+    # root codes need the supplier ids and new associations the root code
+    # ids; the fail code and oos updates don't wait on anything
+    stages = {}
+    if len(df_root_code) > 0:
+        stages['suppliers'] = (upsert_suppliers, [])
+        stages['root_codes'] = (upsert_root_codes, ['suppliers'])
+        stages['rc_associations'] = (insert_rc_associations, ['root_codes'])
+    if len(df_fail_code) > 0:
+        stages['fail_codes'] = (update_fail_codes, [])
+    if len(df_oos) > 0:
+        stages['oos'] = (update_oos, [])
+
+    done, timings, failed = run_stages(stages)
+    print_timings(timings, failed)
+    print_limits(sf_api)
+    if len(failed) == 0:
+        journal.finish(run_id)
+    journal.close()
+    # the other stages have been given their chance, now the first
+    # real failure surfaces as it used to
+    for error in failed.values():
+        if not isinstance(error, StageError):
+            raise error
+    return done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('import', help='upload new operator sheets')
+    command.add_argument('--workers', type=int)
+    runs = command.add_mutually_exclusive_group()
+    runs.add_argument('--resume', action='store_true',
+                      help='finish interrupted uploads instead of looking for new sheets')
+    runs.add_argument('--abandon', action='store_true',
+                      help='give up interrupted uploads, their sheets are imported again')
+
+    command = commands.add_parser('export', help='download the records as a sheet')
+    command.add_argument('--incremental', action='store_true')
+    command.add_argument('--format', default='xlsx', choices=['xlsx', 'csv', 'parquet'])
+
+    command = commands.add_parser('upload', help='send back the edits of an exported sheet')
+    command.add_argument('fname')
+    command.add_argument('--dry-run', action='store_true')
+    runs = command.add_mutually_exclusive_group()
+    runs.add_argument('--resume', action='store_true',
+                      help='continue an interrupted upload of this sheet')
+    runs.add_argument('--abandon', action='store_true',
+                      help='give up interrupted uploads of this sheet before uploading it')
+
+    args = parser.parse_args()
+    if args.command == 'import':
+        auto_update_records_from_operators_sheets(args.workers, args.resume, args.abandon)
+    elif args.command == 'export':
+        download_records_as_sheet(args.incremental, args.format)
+    else:
+        upload_modified_sheet(args.fname, args.dry_run, args.resume, args.abandon)